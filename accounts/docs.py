@@ -0,0 +1,29 @@
+from django.conf import settings
+
+
+class Placeholder:
+    """
+    Stand-in for the `drf_yasg.openapi` module when the API docs are disabled.
+
+    Any attribute access or call returns the placeholder itself, so the schema
+    arguments passed to `swagger_auto_schema` evaluate without importing drf-yasg.
+    """
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+if settings.API_DOCS_ENABLED:
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    openapi = Placeholder()
+
+    def swagger_auto_schema(**kwargs):
+        """
+        No-op replacement for `drf_yasg.utils.swagger_auto_schema` when the API docs are disabled.
+        """
+        return lambda view: view
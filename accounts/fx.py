@@ -0,0 +1,110 @@
+import decimal
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from accounts.models import ExchangeRate
+
+# Amounts are stored with two decimal places
+CENT = decimal.Decimal('0.01')
+
+# Rounding applied to converted amounts (banker's rounding)
+ROUNDING = decimal.ROUND_HALF_EVEN
+
+
+class RateNotAvailable(Exception):
+    """
+    Raised when no exchange rate is loaded for a pair of currencies.
+    """
+
+
+class RateCache:
+    """
+    In-process cache of the exchange rate table.
+
+    Rates are held in a plain dict keyed by (source, target) currency, so a
+    lookup never touches the database. Every `refresh_interval` seconds the
+    cache checks the version of the table in the database with a single
+    aggregate query and reloads the rates only if the version has changed.
+    """
+
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval
+        self.rates = {}
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def get_refresh_interval(self):
+        """
+        Return the number of seconds between two version checks.
+        """
+        if self.refresh_interval is not None:
+            return self.refresh_interval
+        return getattr(settings, 'FX_RATES_REFRESH_INTERVAL', 60)
+
+    def refresh(self, force=False):
+        """
+        Reload the rate table if its version in the database has changed.
+
+        Args:
+        force (bool): Reload the rate table even if the version is unchanged.
+        """
+        with self.lock:
+            version = ExchangeRate.objects.aggregate(version=Max('version'))['version']
+            if force or version != self.version:
+                # Replace the dict as a whole so readers never see a partial table
+                self.rates = {
+                    (source, target): rate
+                    for source, target, rate in ExchangeRate.objects.values_list(
+                        'source_currency', 'target_currency', 'rate'
+                    )
+                }
+                self.version = version
+            self.checked_at = time.monotonic()
+
+    def clear(self):
+        """
+        Drop the cached rates so that the next lookup reloads them.
+        """
+        with self.lock:
+            self.rates = {}
+            self.version = None
+            self.checked_at = None
+
+    def get_rate(self, source_currency, target_currency):
+        """
+        Return the rate converting `source_currency` into `target_currency`.
+
+        Raises:
+        RateNotAvailable: If the pair is not in the rate table.
+        """
+        if source_currency == target_currency:
+            return decimal.Decimal(1)
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.get_refresh_interval():
+            self.refresh()
+        try:
+            return self.rates[(source_currency, target_currency)]
+        except KeyError:
+            raise RateNotAvailable(f'No exchange rate from {source_currency} to {target_currency}')
+
+    def convert(self, amount, source_currency, target_currency):
+        """
+        Convert `amount` between currencies, rounded to the cent.
+
+        Returns:
+        Decimal: The converted amount, exactly representable with two decimal places.
+        """
+        if source_currency == target_currency:
+            return amount
+        rate = self.get_rate(source_currency, target_currency)
+        # Enough precision for the product of two stored decimals to be exact before rounding
+        with decimal.localcontext() as context:
+            context.prec = 50
+            return (amount * rate).quantize(CENT, rounding=ROUNDING)
+
+
+# The cache shared by every request handled by this process
+rates = RateCache()
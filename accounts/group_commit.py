@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connections
+
+from accounts import ledger
+
+
+class GroupCommitWriter:
+    """
+    In-process writer applying concurrent ledger operations in shared transactions.
+
+    Request threads submit operations to a queue and wait for their own
+    outcome. A single writer thread takes the first waiting operation, gathers
+    the ones submitted within the next `max_delay` seconds, up to `max_batch`
+    operations, and applies them with `ledger.apply_batch` in one database
+    transaction. One commit, and one fsync, is then shared by the whole batch
+    while each caller still gets its own success or insufficient-funds result.
+
+    A writer applies the operations of a single account shard, given by `using`.
+    """
+
+    def __init__(self, max_batch=None, max_delay=None, using=None):
+        self.max_batch = max_batch or settings.LEDGER_GROUP_COMMIT_MAX_BATCH
+        self.max_delay = max_delay if max_delay is not None else settings.LEDGER_GROUP_COMMIT_MAX_DELAY
+        self.using = using
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.commits = 0
+        self.operations = 0
+
+    def submit(self, transaction_type, account_id, to_account_id, amount):
+        """
+        Queue an operation and wait until its batch is committed.
+
+        Args:
+        transaction_type (str): Transaction.DEPOSIT, WITHDRAWAL or TRANSFER.
+        account_id (int): The account the operation applies to, or sends from.
+        to_account_id (int): The receiving account of a transfer, otherwise None.
+        amount (Decimal): The amount, in the currency of `account_id`.
+
+        Returns:
+        str: The outcome message of this operation.
+        """
+        self.start()
+        future = Future()
+        self.queue.put(((transaction_type, account_id, to_account_id, amount), future))
+        return future.result()
+
+    def start(self):
+        """
+        Start the writer thread unless it is already running.
+        """
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self.run, name=f'ledger-group-commit-{self.using}', daemon=True
+                    )
+                    self.thread.start()
+
+    def collect(self):
+        """
+        Wait for the next operation, then gather a batch of the ones following it.
+        """
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(block=timeout > 0, timeout=max(timeout, 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Apply batches forever; a failing batch fails every operation in it.
+        """
+        while True:
+            batch = self.collect()
+            try:
+                outcomes = ledger.apply_batch([operation for operation, _ in batch], self.using)
+            except Exception as exc:
+                # Start the next batch on a fresh connection
+                connections[self.using or 'default'].close()
+                for _, future in batch:
+                    future.set_exception(exc)
+                continue
+            self.commits += 1
+            self.operations += len(batch)
+            for (_, future), outcome in zip(batch, outcomes):
+                future.set_result(outcome)
+
+
+# The writers shared by every request handled by this process, by shard
+writers = {}
+writers_lock = threading.Lock()
+
+
+def get_writer(using):
+    """
+    Return the writer of the given account shard, creating it on first use.
+
+    Args:
+    using (str): The database alias of the shard.
+
+    Returns:
+    GroupCommitWriter: The writer applying the operations of that shard.
+    """
+    if using not in writers:
+        with writers_lock:
+            if using not in writers:
+                writers[using] = GroupCommitWriter(using=using)
+    return writers[using]
@@ -0,0 +1,226 @@
+import decimal
+
+from django.db import transaction
+
+from accounts import fx, outbox, sharding
+from accounts.models import Account, Transaction
+
+# Outcomes reported for each operation applied by the ledger
+DEPOSIT_SUCCESS = 'Deposit successful'
+WITHDRAWAL_SUCCESS = 'Withdrawal successful'
+TRANSFER_SUCCESS = 'Transfer successful'
+INVALID_AMOUNT = 'Invalid amount'
+ACCOUNT_NOT_FOUND = 'Account not found'
+SAME_ACCOUNT = 'Cannot transfer to the same account'
+INSUFFICIENT_FUNDS = 'Insufficient funds'
+RATE_NOT_AVAILABLE = 'Exchange rate not available'
+BALANCE_LIMIT_EXCEEDED = 'Balance limit exceeded'
+TRANSFER_CANCELLED = 'Transfer cancelled and refunded'
+
+# Amounts and balances are stored with max_digits=15 and decimal_places=2
+CENT = decimal.Decimal('0.01')
+MAX_BALANCE = decimal.Decimal('9999999999999.99')
+
+
+def is_valid_amount(amount):
+    """
+    Return whether an amount is positive, finite and storable with two decimal places.
+
+    Args:
+    amount (Decimal): The amount of an operation.
+
+    Returns:
+    bool: Whether the amount can be applied.
+    """
+    return amount.is_finite() and 0 < amount <= MAX_BALANCE and amount == amount.quantize(CENT)
+
+
+def deposit(account_id, amount):
+    """
+    Deposit money into an account.
+
+    The balance, the transaction and its outbox event are written in a single
+    database transaction on the account's shard.
+
+    Args:
+    account_id (int): The ID of the account.
+    amount (Decimal): The amount to deposit.
+
+    Returns:
+    str: The outcome message.
+    """
+
+    if not is_valid_amount(amount):
+        return INVALID_AMOUNT
+    using = sharding.shard_for_pk(account_id)
+    with transaction.atomic(using=using):
+        account = Account.objects.using(using).select_for_update().filter(pk=account_id).first()
+        if account is None:
+            return ACCOUNT_NOT_FOUND
+        if account.balance + amount > MAX_BALANCE:
+            return BALANCE_LIMIT_EXCEEDED
+        account.balance += amount
+        account.save(update_fields=['balance'])
+        entry = Transaction.objects.using(using).create(
+            account=account, amount=amount, transaction_type=Transaction.DEPOSIT
+        )
+        outbox.record([(entry, account.balance)], using)
+    return DEPOSIT_SUCCESS
+
+
+def withdraw(account_id, amount):
+    """
+    Withdraw money from an account.
+
+    The balance, the transaction and its outbox event are written in a single
+    database transaction on the account's shard.
+
+    Args:
+    account_id (int): The ID of the account.
+    amount (Decimal): The amount to withdraw.
+
+    Returns:
+    str: The outcome message.
+    """
+
+    if not is_valid_amount(amount):
+        return INVALID_AMOUNT
+    using = sharding.shard_for_pk(account_id)
+    with transaction.atomic(using=using):
+        account = Account.objects.using(using).select_for_update().filter(pk=account_id).first()
+        if account is None:
+            return ACCOUNT_NOT_FOUND
+        if account.balance < amount:
+            return INSUFFICIENT_FUNDS
+        account.balance -= amount
+        account.save(update_fields=['balance'])
+        entry = Transaction.objects.using(using).create(
+            account=account, amount=-amount, transaction_type=Transaction.WITHDRAWAL
+        )
+        outbox.record([(entry, account.balance)], using)
+    return WITHDRAWAL_SUCCESS
+
+
+def apply_transfers(transfers, using=None):
+    """
+    Apply many transfers in a single database transaction.
+
+    Args:
+    transfers (list): (from_account_id, to_account_id, amount) tuples, the
+        amount being in the currency of the sending account.
+    using (str): The database alias of the shard holding every account involved.
+
+    Returns:
+    list: One outcome message per transfer, in the same order.
+    """
+
+    return apply_batch(
+        [(Transaction.TRANSFER, from_id, to_id, amount) for from_id, to_id, amount in transfers], using
+    )
+
+
+def apply_batch(operations, using=None):
+    """
+    Apply many deposits, withdrawals and transfers in a single database transaction.
+
+    Every account involved is locked once, in primary key order, so that
+    concurrent batches always acquire their locks in the same order. The
+    operations are then applied in memory in the order given and written back
+    with one bulk update of the balances, one bulk insert of the transactions
+    and one bulk insert of their outbox events. Each operation is validated
+    on its own, so that one that cannot be applied, such as a malformed
+    amount or a balance overflowing its column, only fails with its own
+    outcome and does not affect the others.
+
+    Transfers between accounts held in different currencies credit the
+    receiving account with the amount converted at the cached exchange rate.
+    One whose converted amount rounds to zero is rejected as an invalid amount.
+
+    Args:
+    operations (list): (transaction_type, account_id, to_account_id, amount)
+        tuples, where `to_account_id` is None for deposits and withdrawals and
+        the amount is in the currency of `account_id`.
+    using (str): The database alias of the shard holding every account involved.
+        Accounts on other shards are reported as not found.
+
+    Returns:
+    list: One outcome message per operation, in the same order.
+    """
+
+    account_ids = {
+        account_id for _, from_id, to_id, _ in operations for account_id in (from_id, to_id) if account_id is not None
+    }
+    outcomes = []
+    with transaction.atomic(using=using):
+        accounts = {
+            account.pk: account
+            for account in Account.objects.using(using).select_for_update().filter(pk__in=account_ids).order_by('pk')
+        }
+        changed = {}
+        entries = []
+        for transaction_type, from_id, to_id, amount in operations:
+            account = accounts.get(from_id)
+            if not is_valid_amount(amount):
+                outcomes.append(INVALID_AMOUNT)
+            elif account is None:
+                outcomes.append(ACCOUNT_NOT_FOUND)
+            elif transaction_type == Transaction.DEPOSIT:
+                if account.balance + amount > MAX_BALANCE:
+                    outcomes.append(BALANCE_LIMIT_EXCEEDED)
+                    continue
+                account.balance += amount
+                changed[from_id] = account
+                entries.append((
+                    Transaction(account=account, amount=amount, transaction_type=Transaction.DEPOSIT),
+                    account.balance,
+                ))
+                outcomes.append(DEPOSIT_SUCCESS)
+            elif account.balance < amount:
+                outcomes.append(INSUFFICIENT_FUNDS)
+            elif transaction_type == Transaction.WITHDRAWAL:
+                account.balance -= amount
+                changed[from_id] = account
+                entries.append((
+                    Transaction(account=account, amount=-amount, transaction_type=Transaction.WITHDRAWAL),
+                    account.balance,
+                ))
+                outcomes.append(WITHDRAWAL_SUCCESS)
+            else:
+                to_account = accounts.get(to_id)
+                if to_account is None:
+                    outcomes.append(ACCOUNT_NOT_FOUND)
+                    continue
+                if from_id == to_id:
+                    outcomes.append(SAME_ACCOUNT)
+                    continue
+                try:
+                    credit = fx.rates.convert(amount, account.currency, to_account.currency)
+                except fx.RateNotAvailable:
+                    outcomes.append(RATE_NOT_AVAILABLE)
+                    continue
+                if credit <= 0:
+                    # The converted amount rounds to nothing: the debit would be lost
+                    outcomes.append(INVALID_AMOUNT)
+                    continue
+                if to_account.balance + credit > MAX_BALANCE:
+                    outcomes.append(BALANCE_LIMIT_EXCEEDED)
+                    continue
+                account.balance -= amount
+                to_account.balance += credit
+                changed[from_id] = account
+                changed[to_id] = to_account
+                entries.append((
+                    Transaction(account=account, amount=-amount, transaction_type=Transaction.TRANSFER),
+                    account.balance,
+                ))
+                entries.append((
+                    Transaction(account=to_account, amount=credit, transaction_type=Transaction.TRANSFER),
+                    to_account.balance,
+                ))
+                outcomes.append(TRANSFER_SUCCESS)
+
+        if changed:
+            Account.objects.using(using).bulk_update(list(changed.values()), ['balance'])
+            Transaction.objects.using(using).bulk_create([entry for entry, _ in entries])
+            outbox.record(entries, using)
+    return outcomes
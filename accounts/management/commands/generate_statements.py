@@ -0,0 +1,106 @@
+import datetime
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.statements import (
+    RENDERERS, StatementStore, iter_statements, month_bounds, render_in_worker, render_statement, statement_digest
+)
+
+
+class Command(BaseCommand):
+    """
+    Django management command to generate the monthly statements of every account.
+    Streams each shard's transactions for the month, renders the statements
+    whose data changed since the last run in a pool of worker processes, and
+    writes them to the statement store served by the statements endpoint.
+    """
+
+    help = 'Render the monthly statements of every account as text, CSV and HTML files'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line options of the command.
+        """
+        parser.add_argument('--month', help='Month to generate statements for, as YYYY-MM (default: last month)')
+        parser.add_argument('--formats', default=','.join(RENDERERS),
+                            help=f'Comma-separated formats to render, among {", ".join(RENDERERS)}')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes rendering statements')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Number of rows fetched from the database at a time')
+        parser.add_argument('--force', action='store_true',
+                            help='Render every statement, even those whose data has not changed')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Renders the statements and reports how many were rendered and skipped.
+        """
+        workers = options['workers']
+        chunk_size = options['chunk_size']
+        if workers < 1 or chunk_size < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        month = options['month'] or f'{timezone.localdate().replace(day=1) - datetime.timedelta(days=1):%Y-%m}'
+        try:
+            month_bounds(month)
+        except ValueError:
+            raise CommandError('--month must be a month as YYYY-MM')
+
+        formats = [fmt for fmt in options['formats'].split(',') if fmt]
+        unknown = set(formats) - set(RENDERERS)
+        if not formats or unknown:
+            raise CommandError(f'--formats must be among {", ".join(RENDERERS)}')
+
+        store = StatementStore(settings.STATEMENTS_ROOT)
+        started = time.perf_counter()
+        rendered = skipped = 0
+
+        def pending_statements():
+            nonlocal skipped
+            for using in settings.ACCOUNT_SHARDS:
+                for statement in iter_statements(month, using, chunk_size):
+                    digest = statement_digest(statement)
+                    stale = formats if options['force'] else store.stale_formats(
+                        statement['account'], month, digest, formats
+                    )
+                    if stale:
+                        yield statement, digest, stale
+                    else:
+                        skipped += 1
+
+        if workers == 1:
+            for statement, digest, stale in pending_statements():
+                store.save(statement['account'], month, digest, render_statement(statement, stale))
+                rendered += 1
+        else:
+            # Keep a bounded number of statements in flight so that memory does not grow with the number of accounts
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = {}
+                for statement, digest, stale in pending_statements():
+                    future = pool.submit(render_in_worker, statement, stale)
+                    in_flight[future] = (statement['account'], digest)
+                    if len(in_flight) >= workers * 4:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        rendered += self.save_done(store, month, in_flight, done)
+                rendered += self.save_done(store, month, in_flight, list(in_flight))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} and skipped {skipped} unchanged statements for {month} '
+            f'in {elapsed:.2f}s with {workers} worker(s)'
+        ))
+
+    def save_done(self, store, month, in_flight, done):
+        """
+        Write the statements rendered by the given futures and return how many there were.
+        """
+        for future in done:
+            account_id, digest = in_flight.pop(future)
+            store.save(account_id, month, digest, future.result())
+        return len(done)
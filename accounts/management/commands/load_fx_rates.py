@@ -0,0 +1,56 @@
+import csv
+import decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from accounts.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    """
+    Django management command to load the exchange rate table from a CSV file.
+    Each line holds a source currency, a target currency and a rate. The loaded
+    rates replace the current table under a new version, which running
+    processes pick up on their next cache refresh.
+    """
+
+    help = 'Load exchange rates from a CSV file of source,target,rate lines'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line arguments of the command.
+        """
+        parser.add_argument('path', help='Path to the CSV file of exchange rates')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Parses the file and replaces the exchange rate table in one transaction.
+        """
+        rates = {}
+        with open(options['path'], newline='') as rates_file:
+            for line_number, row in enumerate(csv.reader(rates_file), start=1):
+                if not row or row[0].startswith('#'):
+                    continue
+                try:
+                    source, target, rate = (value.strip() for value in row)
+                    rate = decimal.Decimal(rate)
+                except (ValueError, decimal.InvalidOperation):
+                    raise CommandError(f'Line {line_number}: expected source,target,rate')
+                if rate <= 0:
+                    raise CommandError(f'Line {line_number}: rate must be positive')
+                rates[(source.upper(), target.upper())] = rate
+        if not rates:
+            raise CommandError('The file does not contain any exchange rate')
+
+        with transaction.atomic():
+            version = (ExchangeRate.objects.aggregate(version=Max('version'))['version'] or 0) + 1
+            ExchangeRate.objects.all().delete()
+            ExchangeRate.objects.bulk_create([
+                ExchangeRate(source_currency=source, target_currency=target, rate=rate, version=version)
+                for (source, target), rate in rates.items()
+            ])
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rates)} exchange rates as version {version}'))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from accounts.sharding import set_id_offset
+
+
+class Command(BaseCommand):
+    """
+    Django management command to bring every account shard up to date.
+    Applies the migrations to each database in `ACCOUNT_SHARDS`, then makes
+    each shard number its accounts, transactions and events within its own
+    range of IDs.
+    """
+
+    help = 'Apply migrations to every account shard and set up their ID ranges'
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Migrates the shards one after the other.
+        """
+        for using in settings.ACCOUNT_SHARDS:
+            self.stdout.write(f'Migrating {using}')
+            call_command('migrate', database=using, interactive=False, verbosity=options['verbosity'])
+            set_id_offset(using)
+
+        self.stdout.write(self.style.SUCCESS(f'Migrated {len(settings.ACCOUNT_SHARDS)} shards'))
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.profiling import aggregate
+
+
+class Command(BaseCommand):
+    """
+    Django management command to summarize the requests captured by the profiling middleware.
+    Aggregates every cProfile and collapsed-stack capture into the functions
+    where the most time was spent, followed by the queries taking the most
+    time overall.
+    """
+
+    help = 'Report the hottest functions and queries of the profiled requests'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line options of the command.
+        """
+        parser.add_argument('--url-name', action='append', dest='url_names',
+                            help='Only report captures of this URL name (may be repeated)')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of functions and queries to report')
+        parser.add_argument('--sort', choices=['self', 'total'], default='self',
+                            help='Rank functions by time spent in their own code or including their callees')
+        parser.add_argument('--dir', default=None,
+                            help='Directory holding the captures (default: PROFILING_DIR)')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Prints the top functions and queries across the selected captures.
+        """
+        if options['top'] < 1:
+            raise CommandError('--top must be positive')
+        directory = options['dir'] or settings.PROFILING_DIR
+
+        captures, functions, queries = aggregate(directory, options['url_names'])
+        if not captures:
+            raise CommandError(f'No captures found in {directory}')
+
+        column = 0 if options['sort'] == 'self' else 1
+        self.stdout.write(f'Hot functions across {captures} captures')
+        self.stdout.write(f'{"self (s)":>10} {"total (s)":>10}  function')
+        for label, (self_time, total_time) in sorted(functions.items(), key=lambda item: -item[1][column])[
+                :options['top']]:
+            self.stdout.write(f'{self_time:>10.4f} {total_time:>10.4f}  {label}')
+
+        self.stdout.write('')
+        self.stdout.write('Slowest queries')
+        self.stdout.write(f'{"total (s)":>10} {"count":>6}  query')
+        for sql, (count, total_time) in sorted(queries.items(), key=lambda item: -item[1][1])[:options['top']]:
+            self.stdout.write(f'{total_time:>10.4f} {count:>6}  {sql}')
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.sagas import recover_pending
+
+
+class Command(BaseCommand):
+    """
+    Django management command to resolve interrupted cross-shard transfers.
+    Every transfer whose debit is still pending after `--older-than` seconds
+    is completed if its credit was committed, and refunded otherwise.
+    """
+
+    help = 'Complete or compensate cross-shard transfers left pending'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line options of the command.
+        """
+        parser.add_argument('--older-than', type=float, default=60,
+                            help='Only resolve transfers pending for at least this many seconds')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Resolves the pending transfers and reports how each was settled.
+        """
+        if options['older_than'] < 0:
+            raise CommandError('--older-than must not be negative')
+
+        before = timezone.now() - timedelta(seconds=options['older_than'])
+        completed, compensated = recover_pending(before)
+        self.stdout.write(self.style.SUCCESS(
+            f'Completed {completed} and compensated {compensated} pending transfers'
+        ))
@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import outbox
+
+
+class Command(BaseCommand):
+    """
+    Django management command to publish outbox events to a downstream sink.
+    Tails the outbox of every account shard in batches, publishing events in
+    ID order and marking them as published once the sink has accepted them.
+    """
+
+    help = 'Publish ledger events from the outbox to a file, a local socket or an in-memory broker'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line options of the command.
+        """
+        parser.add_argument('--sink', default='memory',
+                            help='file:<path>, socket:<host:port or path> or memory')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum number of events published at once')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait before polling again once the outbox is drained')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the outbox is drained instead of tailing it')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Relays events until the outbox is drained, or forever unless `--once` is given.
+        """
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        try:
+            sink = outbox.get_sink(options['sink'])
+        except (ValueError, OSError) as exc:
+            raise CommandError(str(exc))
+
+        published = 0
+        try:
+            while True:
+                count = sum(
+                    outbox.relay_batch(sink, options['batch_size'], using) for using in settings.ACCOUNT_SHARDS
+                )
+                published += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Published {published} events to {options["sink"]}'))
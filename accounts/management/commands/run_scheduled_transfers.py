@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.scheduling import execute_due, execute_due_in_worker
+
+
+class Command(BaseCommand):
+    """
+    Django management command to execute scheduled transfers that are due.
+    Due transfers are claimed in batches and applied through the batched ledger,
+    optionally by several worker processes, and the throughput is reported.
+    """
+
+    help = 'Execute scheduled transfers that are due'
+
+    def add_arguments(self, parser):
+        """
+        Define the command line options of the command.
+        """
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum number of transfers claimed per database transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes draining the queue')
+        parser.add_argument('--now', help='Execute transfers due at or before this ISO 8601 date and time')
+
+    def handle(self, *args, **options):
+        """
+        The entry point for the command.
+        Executes every due transfer and reports the outcome counts and throughput.
+        """
+        batch_size = options['batch_size']
+        workers = options['workers']
+        if batch_size < 1 or workers < 1:
+            raise CommandError('--batch-size and --workers must be positive')
+
+        now = timezone.now()
+        if options['now']:
+            now = parse_datetime(options['now'])
+            if now is None:
+                raise CommandError('--now must be an ISO 8601 date and time')
+            if timezone.is_naive(now):
+                now = timezone.make_aware(now)
+
+        # Without SKIP LOCKED, concurrent workers could claim the same transfers
+        if workers > 1 and not connection.features.has_select_for_update_skip_locked:
+            self.stderr.write(self.style.WARNING(
+                f'{connection.vendor} does not support SKIP LOCKED, running with a single worker'
+            ))
+            workers = 1
+
+        started = time.perf_counter()
+        if workers == 1:
+            results = [execute_due(now, batch_size, using) for using in settings.ACCOUNT_SHARDS]
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(execute_due_in_worker, now, batch_size, using)
+                    for using in settings.ACCOUNT_SHARDS for _ in range(workers)
+                ]
+                results = [future.result() for future in futures]
+        succeeded = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        elapsed = time.perf_counter() - started
+
+        total = succeeded + failed
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Executed {total} scheduled transfers ({succeeded} succeeded, {failed} failed) '
+            f'in {elapsed:.2f}s with {workers} worker(s): {rate:.1f} transfers/s'
+        ))
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.14 on 2026-10-19 07:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(0)])),
+                ('frequency', models.CharField(choices=[('O', 'Once'), ('D', 'Daily'), ('W', 'Weekly'), ('M', 'Monthly')], default='O', max_length=1)),
+                ('next_run_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('A', 'Active'), ('C', 'Completed'), ('F', 'Failed')], default='A', max_length=1)),
+                ('from_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_scheduled_transfers', to='accounts.account')),
+                ('to_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_scheduled_transfers', to='accounts.account')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScheduledTransferRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_at', models.DateTimeField()),
+                ('executed_at', models.DateTimeField(auto_now_add=True)),
+                ('outcome', models.CharField(choices=[('S', 'Succeeded'), ('F', 'Failed')], max_length=1)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('scheduled_transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='accounts.scheduledtransfer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='scheduledtransfer',
+            index=models.Index(fields=['status', 'next_run_at'], name='accounts_sc_status_b26475_idx'),
+        ),
+    ]
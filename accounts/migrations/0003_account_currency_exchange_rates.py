@@ -0,0 +1,32 @@
+# Generated by Django 4.2.14 on 2026-10-19 07:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_scheduled_transfers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='currency',
+            field=models.CharField(default='EUR', max_length=3, validators=[django.core.validators.RegexValidator(message='Currency must be a three-letter ISO 4217 code', regex='^[A-Z]{3}$')]),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_currency', models.CharField(max_length=3, validators=[django.core.validators.RegexValidator(regex='^[A-Z]{3}$')])),
+                ('target_currency', models.CharField(max_length=3, validators=[django.core.validators.RegexValidator(regex='^[A-Z]{3}$')])),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20, validators=[django.core.validators.MinValueValidator(0)])),
+                ('version', models.PositiveIntegerField(db_index=True, default=1)),
+            ],
+            options={
+                'unique_together': {('source_currency', 'target_currency')},
+            },
+        ),
+    ]
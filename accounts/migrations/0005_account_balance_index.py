@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-19 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_outbox_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['balance', 'id'], name='accounts_ac_balance_b8157f_idx'),
+        ),
+    ]
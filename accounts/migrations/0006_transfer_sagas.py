@@ -0,0 +1,31 @@
+# Generated by Django 4.2.14 on 2026-10-19 07:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_account_balance_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferSaga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.UUIDField()),
+                ('role', models.CharField(choices=[('D', 'Debit'), ('C', 'Credit')], max_length=1)),
+                ('from_account_id', models.BigIntegerField()),
+                ('to_account_id', models.BigIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(0)])),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('C', 'Completed'), ('X', 'Compensated')], default='P', max_length=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='accounts_tr_status_e87a20_idx')],
+                'unique_together': {('key', 'role')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+
+def anchor_on_next_run(apps, schema_editor):
+    ScheduledTransfer = apps.get_model('accounts', 'ScheduledTransfer')
+    ScheduledTransfer.objects.using(schema_editor.connection.alias).update(first_run_at=models.F('next_run_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_transfer_sagas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledtransfer',
+            name='first_run_at',
+            field=models.DateTimeField(null=True),
+        ),
+        # Existing transfers are anchored on their next run, the best date known for them
+        migrations.RunPython(anchor_on_next_run, migrations.RunPython.noop, hints={'model_name': 'scheduledtransfer'}),
+        migrations.AlterField(
+            model_name='scheduledtransfer',
+            name='first_run_at',
+            field=models.DateTimeField(),
+        ),
+    ]
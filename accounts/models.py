@@ -1,9 +1,29 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.core.validators import MinValueValidator, RegexValidator
 
+from accounts.sharding import shard_for_iban
+
 # Regular expression for validating IBAN format
 IBAN_REGEX = r'^[A-Z]{2}\d{2}[A-Z0-9]{1,30}$'
 
+# Regular expression for validating ISO 4217 currency codes
+CURRENCY_REGEX = r'^[A-Z]{3}$'
+
+# Currency given to accounts created without one
+DEFAULT_CURRENCY = 'EUR'
+
+
+class AccountQuerySet(models.QuerySet):
+    """
+    QuerySet creating each account on the shard its IBAN belongs to.
+    """
+
+    def create(self, **kwargs):
+        if self._db is None:
+            return self.using(shard_for_iban(kwargs['iban'])).create(**kwargs)
+        return super().create(**kwargs)
+
 
 class Account(models.Model):
     """
@@ -12,6 +32,7 @@ class Account(models.Model):
     Attributes:
         iban (str): The International Bank Account Number (IBAN) of the account.
         balance (decimal): The current balance of the account.
+        currency (str): The ISO 4217 code of the currency the balance is held in.
     """
 
     iban = models.CharField(
@@ -25,6 +46,24 @@ class Account(models.Model):
         ]
     )
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    currency = models.CharField(
+        max_length=3,
+        default=DEFAULT_CURRENCY,
+        validators=[
+            RegexValidator(
+                regex=CURRENCY_REGEX,
+                message='Currency must be a three-letter ISO 4217 code'
+            )
+        ]
+    )
+
+    objects = AccountQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves balance range filters and keyset pagination ordered by balance
+            models.Index(fields=['balance', 'id']),
+        ]
 
     def __str__(self):
         """
@@ -67,3 +106,247 @@ class Transaction(models.Model):
         This includes the transaction type and the amount.
         """
         return f"{self.get_transaction_type_display()} - {self.amount}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Model representing a ledger change waiting to be published downstream.
+
+    An event is written in the same database transaction as every transaction
+    row, and published later by the `relay_outbox` command.
+
+    Attributes:
+        account (ForeignKey): The account whose balance changed.
+        event_type (str): The type of the underlying transaction (Deposit, Withdrawal, Transfer).
+        payload (dict): The transaction and the resulting balance of the account.
+        created_at (datetime): The date and time the event was recorded.
+        published_at (datetime): The date and time the event was relayed, if it has been.
+    """
+
+    account = models.ForeignKey(Account, related_name='events', on_delete=models.CASCADE)
+    event_type = models.CharField(max_length=1, choices=Transaction.TRANSACTION_TYPES)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves `GET /api/accounts/<pk>/events/?after=<id>`
+            models.Index(fields=['account', 'id']),
+            # Lets the relay find unpublished events without scanning published ones
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True), name='outbox_unpublished_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representation of the event.
+        This includes the event type and the account.
+        """
+        return f"{self.get_event_type_display()} - {self.account_id}"
+
+    def to_message(self):
+        """
+        Returns the event as the JSON-serializable message published to sinks.
+        """
+        return {
+            'id': self.pk,
+            'account': self.account_id,
+            'event_type': self.event_type,
+            'payload': self.payload,
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+class ExchangeRate(models.Model):
+    """
+    Model representing the rate used to convert one currency into another.
+
+    Rates are loaded from a file by the `load_fx_rates` command, which bumps the
+    version of every row so that running processes know to refresh their cache.
+
+    Attributes:
+        source_currency (str): The currency being converted from.
+        target_currency (str): The currency being converted to.
+        rate (decimal): The amount of target currency per unit of source currency.
+        version (int): The version of the rate table the row belongs to.
+    """
+
+    source_currency = models.CharField(max_length=3, validators=[RegexValidator(regex=CURRENCY_REGEX)])
+    target_currency = models.CharField(max_length=3, validators=[RegexValidator(regex=CURRENCY_REGEX)])
+    rate = models.DecimalField(max_digits=20, decimal_places=10, validators=[MinValueValidator(0)])
+    version = models.PositiveIntegerField(default=1, db_index=True)
+
+    class Meta:
+        unique_together = [('source_currency', 'target_currency')]
+
+    def __str__(self):
+        """
+        Returns a string representation of the exchange rate.
+        This includes both currencies and the rate.
+        """
+        return f"{self.source_currency}/{self.target_currency} {self.rate}"
+
+
+class ScheduledTransfer(models.Model):
+    """
+    Model representing a standing order: a transfer that is executed once or
+    repeatedly at a given frequency by the `run_scheduled_transfers` command.
+
+    Attributes:
+        from_account (ForeignKey): The account the money is taken from.
+        to_account (ForeignKey): The account the money is sent to.
+        amount (decimal): The amount transferred on each run.
+        frequency (str): How often the transfer repeats (Once, Daily, Weekly, Monthly).
+        first_run_at (datetime): The date and time the transfer was first due, from
+            which every later run is computed so that monthly runs keep their day.
+        next_run_at (datetime): The date and time the transfer is next due.
+        status (str): Whether the transfer is still active, completed or failed.
+    """
+
+    # Frequency choices
+    ONCE = 'O'
+    DAILY = 'D'
+    WEEKLY = 'W'
+    MONTHLY = 'M'
+
+    FREQUENCIES = [
+        (ONCE, 'Once'),
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+    ]
+
+    # Status choices
+    ACTIVE = 'A'
+    COMPLETED = 'C'
+    FAILED = 'F'
+
+    STATUSES = [
+        (ACTIVE, 'Active'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    from_account = models.ForeignKey(Account, related_name='outgoing_scheduled_transfers', on_delete=models.CASCADE)
+    to_account = models.ForeignKey(Account, related_name='incoming_scheduled_transfers', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(0)])
+    frequency = models.CharField(max_length=1, choices=FREQUENCIES, default=ONCE)
+    first_run_at = models.DateTimeField()
+    next_run_at = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=STATUSES, default=ACTIVE)
+
+    class Meta:
+        # The executor only ever looks for active transfers that are due
+        indexes = [models.Index(fields=['status', 'next_run_at'])]
+
+    def __str__(self):
+        """
+        Returns a string representation of the scheduled transfer.
+        This includes both IBANs, the amount and the frequency.
+        """
+        return f"{self.from_account} -> {self.to_account}: {self.amount} ({self.get_frequency_display()})"
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the scheduled transfer, anchoring its runs on its first due time when not given.
+        """
+        if self.first_run_at is None:
+            self.first_run_at = self.next_run_at
+        super().save(*args, **kwargs)
+
+
+class ScheduledTransferRun(models.Model):
+    """
+    Model recording the outcome of a single execution of a scheduled transfer.
+
+    Attributes:
+        scheduled_transfer (ForeignKey): The scheduled transfer that was executed.
+        due_at (datetime): The date and time the execution was due.
+        executed_at (datetime): The date and time the execution took place.
+        outcome (str): Whether the execution succeeded or failed.
+        detail (str): A short explanation of the outcome.
+    """
+
+    # Outcome choices
+    SUCCEEDED = 'S'
+    FAILED = 'F'
+
+    OUTCOMES = [
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    scheduled_transfer = models.ForeignKey(ScheduledTransfer, related_name='runs', on_delete=models.CASCADE)
+    due_at = models.DateTimeField()
+    executed_at = models.DateTimeField(auto_now_add=True)
+    outcome = models.CharField(max_length=1, choices=OUTCOMES)
+    detail = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        """
+        Returns a string representation of the run.
+        This includes the outcome and the due date.
+        """
+        return f"{self.get_outcome_display()} - {self.due_at}"
+
+
+class TransferSaga(models.Model):
+    """
+    Model recording one side of a transfer between accounts on different shards.
+
+    The sending shard holds the debit side, written with the debit and
+    completed once the receiving shard has committed the credit side along
+    with the credit. A debit left pending is either completed or compensated
+    with a refund by the `recover_transfer_sagas` command. The unique
+    (key, role) pair lets the recovery fence off a credit that never arrived
+    by inserting a compensated credit side first.
+
+    Attributes:
+        key (UUID): The identifier shared by both sides of the transfer.
+        role (str): Which side of the transfer this row is (Debit, Credit).
+        from_account_id (int): The ID of the sending account.
+        to_account_id (int): The ID of the receiving account.
+        amount (decimal): The amount taken from, or credited to, the account of this side.
+        status (str): Whether this side is pending, completed or compensated.
+        created_at (datetime): The date and time this side was written.
+    """
+
+    # Role choices
+    DEBIT = 'D'
+    CREDIT = 'C'
+
+    ROLES = [
+        (DEBIT, 'Debit'),
+        (CREDIT, 'Credit'),
+    ]
+
+    # Status choices
+    PENDING = 'P'
+    COMPLETED = 'C'
+    COMPENSATED = 'X'
+
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (COMPLETED, 'Completed'),
+        (COMPENSATED, 'Compensated'),
+    ]
+
+    key = models.UUIDField()
+    role = models.CharField(max_length=1, choices=ROLES)
+    from_account_id = models.BigIntegerField()
+    to_account_id = models.BigIntegerField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(0)])
+    status = models.CharField(max_length=1, choices=STATUSES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('key', 'role')]
+        # The recovery only ever looks for pending sides older than a cutoff
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        """
+        Returns a string representation of the saga side.
+        This includes the role, the status and the key.
+        """
+        return f"{self.get_role_display()} {self.get_status_display()} - {self.key}"
@@ -0,0 +1,139 @@
+import json
+import socket
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from accounts.models import OutboxEvent
+
+
+def record(entries, using=None):
+    """
+    Write one outbox event per transaction row.
+
+    Must be called inside the database transaction that creates the rows, so
+    that an event exists if and only if its transaction was committed.
+
+    Args:
+    entries (list): (transaction, balance) pairs, the balance being the balance
+        of the transaction's account right after it was applied.
+    using (str): The database alias of the account shard holding the rows.
+    """
+
+    OutboxEvent.objects.using(using).bulk_create([
+        OutboxEvent(
+            account_id=entry.account_id,
+            event_type=entry.transaction_type,
+            payload={
+                'transaction': entry.pk,
+                'amount': str(entry.amount),
+                'date': entry.date,
+                'balance': str(balance),
+            },
+        )
+        for entry, balance in entries
+    ])
+
+
+class FileSink:
+    """
+    Sink appending each message to a file as one line of JSON.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def publish(self, messages):
+        for message in messages:
+            self.file.write(json.dumps(message, cls=DjangoJSONEncoder) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class SocketSink:
+    """
+    Sink streaming messages as lines of JSON to a local socket.
+
+    The address is either `host:port` for a TCP socket or the path of a Unix socket.
+    """
+
+    def __init__(self, address):
+        host, _, port = address.rpartition(':')
+        if host and port.isdigit():
+            self.socket = socket.create_connection((host, int(port)))
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(address)
+
+    def publish(self, messages):
+        data = ''.join(json.dumps(message, cls=DjangoJSONEncoder) + '\n' for message in messages)
+        self.socket.sendall(data.encode())
+
+    def close(self):
+        self.socket.close()
+
+
+class MemorySink:
+    """
+    In-process stand-in for a message broker, keeping every published message in a list.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, messages):
+        self.messages.extend(messages)
+
+    def close(self):
+        pass
+
+
+# The broker stand-in shared by every relay running in this process
+memory_sink = MemorySink()
+
+
+def get_sink(spec):
+    """
+    Build the sink described by `spec`.
+
+    Args:
+    spec (str): `file:<path>`, `socket:<host:port or path>` or `memory`.
+
+    Returns:
+    The sink, exposing `publish(messages)` and `close()`.
+    """
+
+    kind, _, target = spec.partition(':')
+    if kind == 'file' and target:
+        return FileSink(target)
+    if kind == 'socket' and target:
+        return SocketSink(target)
+    if kind == 'memory':
+        return memory_sink
+    raise ValueError(f'Unknown outbox sink: {spec}')
+
+
+def relay_batch(sink, batch_size, using=None):
+    """
+    Publish the oldest unpublished events and mark them as published.
+
+    Events are marked only after the sink accepted them, so delivery is at
+    least once: consumers should deduplicate on the event id.
+
+    Args:
+    sink: The sink to publish to.
+    batch_size (int): The maximum number of events to publish.
+    using (str): The database alias of the account shard to relay from.
+
+    Returns:
+    int: The number of events published.
+    """
+
+    events = list(OutboxEvent.objects.using(using).filter(published_at__isnull=True).order_by('id')[:batch_size])
+    if not events:
+        return 0
+    sink.publish([event.to_message() for event in events])
+    OutboxEvent.objects.using(using).filter(pk__in=[event.pk for event in events]).update(published_at=timezone.now())
+    return len(events)
@@ -0,0 +1,240 @@
+import collections
+import contextlib
+import cProfile
+import itertools
+import json
+import math
+import pstats
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+from accounts.sql import normalize_sql
+
+
+class StackSampler:
+    """
+    Sampling profiler recording the call stack of one thread at a fixed interval.
+
+    A background thread reads the stack of the profiled thread every
+    `interval` seconds, so the profiled code runs at full speed. Stacks are
+    counted in the collapsed format used by flame graph tools: one line per
+    distinct stack, outermost frame first, frames separated by semicolons,
+    followed by the number of samples.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code.co_name, frame.f_code.co_filename, frame.f_code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """
+        Return the recorded stacks in the collapsed format.
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def frame_label(function, filename, line):
+    """
+    Return the label of a function, shared by cProfile and collapsed-stack captures.
+    """
+    return f'{function} ({filename}:{line})'
+
+
+class Capture:
+    """
+    Profile and SQL queries of a single request.
+
+    Queries are recorded on every database connection of the request's
+    thread, so those sent to any account shard are included.
+    """
+
+    def __init__(self, url_name, sampled):
+        self.url_name = url_name
+        self.sampled = sampled
+        self.format = settings.PROFILING_FORMAT
+        self.queries = []
+        self.exit_stack = contextlib.ExitStack()
+
+    def start(self):
+        for alias in connections:
+            self.exit_stack.enter_context(connections[alias].execute_wrapper(self.query_recorder(alias)))
+        if self.format == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.profiler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+            self.profiler.start()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        if self.format == 'cprofile':
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        self.exit_stack.close()
+
+    def query_recorder(self, alias):
+        """
+        Build the execute wrapper recording the queries sent through a connection.
+        """
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append({'alias': alias, 'sql': sql, 'time': time.perf_counter() - started})
+        return record
+
+    def save(self, directory, request, response):
+        """
+        Write the profile and a JSON file describing the request and its queries.
+
+        Args:
+        directory (Path): The directory holding the captures, by URL name.
+        request (HttpRequest): The profiled request.
+        response (HttpResponse): Its response.
+
+        Returns:
+        Path: The path of the JSON file.
+        """
+        directory = Path(directory) / self.url_name
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        if self.format == 'cprofile':
+            profile = directory / f'{stem}.prof'
+            self.profiler.dump_stats(profile)
+        else:
+            profile = directory / f'{stem}.collapsed'
+            profile.write_text(self.profiler.collapsed())
+
+        path = directory / f'{stem}.json'
+        path.write_text(json.dumps({
+            'url_name': self.url_name,
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration': self.duration,
+            'reason': 'sampled' if self.sampled else 'slow',
+            'profile': profile.name,
+            'format': self.format,
+            'interval': settings.PROFILING_SAMPLE_INTERVAL,
+            'queries': self.queries,
+        }, indent=2))
+        return path
+
+
+class ProfilingMiddleware:
+    """
+    Middleware profiling sampled or slow requests of selected URL names.
+
+    `PROFILING_RULES` maps URL names to rules: with `sample_every: N`, one
+    request in N is profiled and kept; with `slower_than: S`, every request is
+    profiled and kept if it took S seconds or more. Each kept request is saved
+    to `PROFILING_DIR` as a cProfile or collapsed-stack profile next to its SQL
+    queries, to be summarized by the `profile_report` command.
+
+    Requests of other URL names are not profiled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = settings.PROFILING_RULES
+        self.counters = {url_name: itertools.count() for url_name in self.rules}
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        capture = getattr(request, 'profile_capture', None)
+        if capture is not None:
+            capture.stop()
+            slower_than = self.rules[capture.url_name].get('slower_than', math.inf)
+            if capture.sampled or capture.duration >= slower_than:
+                capture.save(settings.PROFILING_DIR, request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Start profiling the view if its URL name has a rule selecting this request.
+        """
+        url_name = request.resolver_match.url_name
+        rule = self.rules.get(url_name)
+        if rule is None:
+            return None
+        sampled = 'sample_every' in rule and next(self.counters[url_name]) % rule['sample_every'] == 0
+        if sampled or 'slower_than' in rule:
+            request.profile_capture = Capture(url_name, sampled)
+            request.profile_capture.start()
+        return None
+
+
+def aggregate(directory, url_names=None):
+    """
+    Sum the profiles and queries of every capture saved under a directory.
+
+    cProfile captures contribute their measured times. Collapsed-stack
+    captures contribute their samples times the sampling interval, which
+    estimates the time spent in each function.
+
+    Args:
+    directory (Path): The directory holding the captures, by URL name.
+    url_names (list): Only aggregate the captures of these URL names, if given.
+
+    Returns:
+    tuple: The number of captures, the (self, total) seconds of each function
+        and the (count, total) seconds of each normalized query.
+    """
+
+    functions = collections.defaultdict(lambda: [0.0, 0.0])
+    queries = collections.defaultdict(lambda: [0, 0.0])
+    captures = 0
+    for path in sorted(Path(directory).glob('*/*.json')):
+        capture = json.loads(path.read_text())
+        if url_names and capture['url_name'] not in url_names:
+            continue
+        captures += 1
+        for query in capture['queries']:
+            stats = queries[normalize_sql(query['sql'])]
+            stats[0] += 1
+            stats[1] += query['time']
+
+        profile = path.with_name(capture['profile'])
+        if capture['format'] == 'cprofile':
+            for (filename, line, function), (_, _, self_time, total_time, _) in pstats.Stats(str(profile)).stats.items():
+                stats = functions[frame_label(function, filename, line)]
+                stats[0] += self_time
+                stats[1] += total_time
+        else:
+            for entry in profile.read_text().splitlines():
+                stack, count = entry.rsplit(' ', 1)
+                frames = stack.split(';')
+                seconds = int(count) * capture['interval']
+                functions[frames[-1]][0] += seconds
+                for frame in set(frames):
+                    functions[frame][1] += seconds
+    return captures, functions, queries
@@ -0,0 +1,199 @@
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from accounts import fx, ledger, outbox, sharding
+from accounts.models import Account, Transaction, TransferSaga
+
+
+def transfer_across_shards(from_account, to_account, amount):
+    """
+    Transfer money between accounts held on different shards.
+
+    No database transaction spans both shards, so the transfer runs as a saga
+    of local transactions:
+
+    1. On the sending shard, debit the account and record a pending debit side.
+    2. On the receiving shard, credit the account and record the credit side.
+    3. On the sending shard, mark the debit side as completed.
+
+    If the credit cannot be applied, because the receiving account is gone,
+    its balance would exceed the largest storable value or the recovery gave
+    up on the transfer, the debit is compensated with a refund. A saga
+    interrupted between the steps is left pending and resolved by
+    `recover_pending`.
+
+    Args:
+    from_account (Account): The sending account, as read from its shard.
+    to_account (Account): The receiving account, as read from its shard.
+    amount (Decimal): The amount to transfer, in the currency of the sending account.
+
+    Returns:
+    str: The outcome message.
+    """
+
+    if not ledger.is_valid_amount(amount):
+        return ledger.INVALID_AMOUNT
+    try:
+        credit = fx.rates.convert(amount, from_account.currency, to_account.currency)
+    except fx.RateNotAvailable:
+        return ledger.RATE_NOT_AVAILABLE
+    if credit <= 0:
+        return ledger.INVALID_AMOUNT
+
+    saga = TransferSaga(
+        key=uuid.uuid4(), role=TransferSaga.DEBIT,
+        from_account_id=from_account.pk, to_account_id=to_account.pk, amount=amount,
+    )
+    outcome = debit(saga, from_account._state.db)
+    if outcome != ledger.TRANSFER_SUCCESS:
+        return outcome
+    try:
+        outcome = apply_credit(saga, credit, to_account._state.db)
+    except IntegrityError:
+        # The recovery gave up on this transfer before the credit could be applied
+        outcome = ledger.TRANSFER_CANCELLED
+    if outcome == ledger.TRANSFER_SUCCESS:
+        complete(saga.key, from_account._state.db)
+    else:
+        compensate(saga.key, from_account._state.db)
+    return outcome
+
+
+def debit(saga, using):
+    """
+    Debit the sending account and record the pending debit side, in one transaction.
+
+    Args:
+    saga (TransferSaga): The unsaved debit side of the transfer.
+    using (str): The database alias of the sending shard.
+
+    Returns:
+    str: The outcome message.
+    """
+
+    with transaction.atomic(using=using):
+        account = Account.objects.using(using).select_for_update().filter(pk=saga.from_account_id).first()
+        if account is None:
+            return ledger.ACCOUNT_NOT_FOUND
+        if account.balance < saga.amount:
+            return ledger.INSUFFICIENT_FUNDS
+        account.balance -= saga.amount
+        account.save(update_fields=['balance'])
+        entry = Transaction.objects.using(using).create(
+            account=account, amount=-saga.amount, transaction_type=Transaction.TRANSFER
+        )
+        outbox.record([(entry, account.balance)], using)
+        saga.save(using=using)
+    return ledger.TRANSFER_SUCCESS
+
+
+def apply_credit(saga, credit, using):
+    """
+    Credit the receiving account and record the credit side, in one transaction.
+
+    Raises IntegrityError if the credit side already exists, which means the
+    recovery has given up on this transfer.
+
+    Args:
+    saga (TransferSaga): The debit side of the transfer.
+    credit (Decimal): The amount to credit, in the currency of the receiving account.
+    using (str): The database alias of the receiving shard.
+
+    Returns:
+    str: The outcome message; nothing is written unless the transfer succeeded.
+    """
+
+    with transaction.atomic(using=using):
+        account = Account.objects.using(using).select_for_update().filter(pk=saga.to_account_id).first()
+        if account is None:
+            return ledger.ACCOUNT_NOT_FOUND
+        if account.balance + credit > ledger.MAX_BALANCE:
+            return ledger.BALANCE_LIMIT_EXCEEDED
+        TransferSaga.objects.using(using).create(
+            key=saga.key, role=TransferSaga.CREDIT, from_account_id=saga.from_account_id,
+            to_account_id=saga.to_account_id, amount=credit, status=TransferSaga.COMPLETED,
+        )
+        account.balance += credit
+        account.save(update_fields=['balance'])
+        entry = Transaction.objects.using(using).create(
+            account=account, amount=credit, transaction_type=Transaction.TRANSFER
+        )
+        outbox.record([(entry, account.balance)], using)
+    return ledger.TRANSFER_SUCCESS
+
+
+def complete(key, using):
+    """
+    Mark a pending debit side as completed once its credit is committed.
+    """
+    TransferSaga.objects.using(using).filter(
+        key=key, role=TransferSaga.DEBIT, status=TransferSaga.PENDING
+    ).update(status=TransferSaga.COMPLETED)
+
+
+def compensate(key, using):
+    """
+    Refund the sending account of a pending debit side whose credit will never be applied.
+
+    The refund is a transfer transaction giving the amount back, so that the
+    history of the account shows both the debit and its reversal. A debit side
+    that is no longer pending is left alone, which makes this safe to retry.
+    """
+
+    with transaction.atomic(using=using):
+        saga = TransferSaga.objects.using(using).select_for_update().filter(
+            key=key, role=TransferSaga.DEBIT, status=TransferSaga.PENDING
+        ).first()
+        if saga is None:
+            return
+        account = Account.objects.using(using).select_for_update().filter(pk=saga.from_account_id).first()
+        if account is not None:
+            account.balance += saga.amount
+            account.save(update_fields=['balance'])
+            entry = Transaction.objects.using(using).create(
+                account=account, amount=saga.amount, transaction_type=Transaction.TRANSFER
+            )
+            outbox.record([(entry, account.balance)], using)
+        saga.status = TransferSaga.COMPENSATED
+        saga.save(update_fields=['status'])
+
+
+def recover_pending(before):
+    """
+    Resolve the debit sides left pending by interrupted cross-shard transfers.
+
+    For each one, a compensated credit side is inserted on the receiving shard.
+    If the insert conflicts, the credit was committed and the debit side is
+    completed; otherwise the inserted row stops the credit from ever being
+    applied and the debit is compensated.
+
+    Args:
+    before (datetime): Only debit sides created before this time are resolved,
+        leaving transfers still in flight alone.
+
+    Returns:
+    tuple: The number of completed and compensated transfers.
+    """
+
+    completed = compensated = 0
+    for using in settings.ACCOUNT_SHARDS:
+        pending = list(TransferSaga.objects.using(using).filter(
+            role=TransferSaga.DEBIT, status=TransferSaga.PENDING, created_at__lt=before
+        ).order_by('pk'))
+        for saga in pending:
+            target = sharding.shard_for_pk(saga.to_account_id)
+            try:
+                with transaction.atomic(using=target):
+                    TransferSaga.objects.using(target).create(
+                        key=saga.key, role=TransferSaga.CREDIT, from_account_id=saga.from_account_id,
+                        to_account_id=saga.to_account_id, amount=0, status=TransferSaga.COMPENSATED,
+                    )
+            except IntegrityError:
+                complete(saga.key, using)
+                completed += 1
+            else:
+                compensate(saga.key, using)
+                compensated += 1
+    return completed, compensated
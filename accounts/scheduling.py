@@ -0,0 +1,148 @@
+import datetime
+
+import django
+from dateutil.relativedelta import relativedelta
+from django.db import connections, transaction
+
+from accounts import ledger
+from accounts.models import ScheduledTransfer, ScheduledTransferRun
+
+# Step applied to `next_run_at` after each run of a recurring transfer
+FREQUENCY_STEPS = {
+    ScheduledTransfer.DAILY: relativedelta(days=1),
+    ScheduledTransfer.WEEKLY: relativedelta(weeks=1),
+    ScheduledTransfer.MONTHLY: relativedelta(months=1),
+}
+
+
+def next_run_after(scheduled, now):
+    """
+    Compute the next time a recurring transfer is due.
+
+    Runs are computed from the first due time plus a whole number of steps,
+    never from the previous run, so that a monthly order for the 31st is due
+    on the last day of shorter months and back on the 31st afterwards.
+
+    Runs missed while the executor was not running are skipped rather than
+    executed one after another, so a standing order is paid at most once per run.
+
+    Args:
+    scheduled (ScheduledTransfer): A recurring scheduled transfer.
+    now (datetime): The time the executor was started for.
+
+    Returns:
+    datetime: The first due time strictly after both `now` and the current due time.
+    """
+
+    step = FREQUENCY_STEPS[scheduled.frequency]
+    first_run_at = scheduled.first_run_at
+    latest = max(now, scheduled.next_run_at)
+    # Count the steps up to `latest` directly, so that the cost does not grow with the age of the order
+    if scheduled.frequency == ScheduledTransfer.MONTHLY:
+        count = (latest.year - first_run_at.year) * 12 + latest.month - first_run_at.month
+    else:
+        count = (latest - first_run_at) // datetime.timedelta(days=step.days)
+    # The estimate is off by at most one step, for days missing at the end of a month or DST changes
+    count = max(count, 1)
+    while count > 1 and first_run_at + step * count > latest:
+        count -= 1
+    while first_run_at + step * count <= latest:
+        count += 1
+    return first_run_at + step * count
+
+
+def execute_due_batch(now, batch_size, using=None):
+    """
+    Claim and execute one batch of due scheduled transfers.
+
+    The batch is claimed with `SELECT ... FOR UPDATE SKIP LOCKED` so that
+    several workers can drain the queue side by side without picking the same
+    rows. Claimed transfers are ordered by account and applied through the
+    batched ledger path; their runs are recorded and their schedules advanced
+    in the same database transaction.
+
+    Scheduled transfers live on the shard of their accounts, which must
+    therefore share a shard.
+
+    Args:
+    now (datetime): Transfers due at or before this time are executed.
+    batch_size (int): The maximum number of transfers to claim.
+    using (str): The database alias of the account shard to execute transfers from.
+
+    Returns:
+    tuple: The number of succeeded and failed transfers in the batch.
+    """
+
+    with transaction.atomic(using=using):
+        batch = list(
+            ScheduledTransfer.objects.using(using).select_for_update(skip_locked=True)
+            .filter(status=ScheduledTransfer.ACTIVE, next_run_at__lte=now)
+            .order_by('from_account_id', 'to_account_id', 'pk')[:batch_size]
+        )
+        if not batch:
+            return 0, 0
+
+        outcomes = ledger.apply_transfers([
+            (scheduled.from_account_id, scheduled.to_account_id, scheduled.amount) for scheduled in batch
+        ], using)
+
+        runs = []
+        succeeded = 0
+        for scheduled, outcome in zip(batch, outcomes):
+            if outcome == ledger.TRANSFER_SUCCESS:
+                succeeded += 1
+                result = ScheduledTransferRun.SUCCEEDED
+            else:
+                result = ScheduledTransferRun.FAILED
+            runs.append(ScheduledTransferRun(
+                scheduled_transfer=scheduled, due_at=scheduled.next_run_at, outcome=result, detail=outcome
+            ))
+
+            if scheduled.frequency == ScheduledTransfer.ONCE:
+                scheduled.status = (
+                    ScheduledTransfer.COMPLETED if result == ScheduledTransferRun.SUCCEEDED
+                    else ScheduledTransfer.FAILED
+                )
+            else:
+                scheduled.next_run_at = next_run_after(scheduled, now)
+
+        ScheduledTransferRun.objects.using(using).bulk_create(runs)
+        ScheduledTransfer.objects.using(using).bulk_update(batch, ['status', 'next_run_at'])
+    return succeeded, len(batch) - succeeded
+
+
+def execute_due(now, batch_size, using=None):
+    """
+    Execute batches of due scheduled transfers until none are left.
+
+    Args:
+    now (datetime): Transfers due at or before this time are executed.
+    batch_size (int): The maximum number of transfers per batch.
+    using (str): The database alias of the account shard to execute transfers from.
+
+    Returns:
+    tuple: The total number of succeeded and failed transfers.
+    """
+
+    succeeded = failed = 0
+    while True:
+        batch_succeeded, batch_failed = execute_due_batch(now, batch_size, using)
+        if not batch_succeeded and not batch_failed:
+            return succeeded, failed
+        succeeded += batch_succeeded
+        failed += batch_failed
+
+
+def execute_due_in_worker(now, batch_size, using=None):
+    """
+    Entry point for executor worker processes.
+
+    Makes sure Django is set up when the process was spawned rather than
+    forked, and closes the worker's connections once the queue is drained.
+    """
+
+    django.setup()
+    try:
+        return execute_due(now, batch_size, using)
+    finally:
+        connections.close_all()
@@ -1,5 +1,8 @@
+from django.core.validators import RegexValidator
 from rest_framework import serializers
-from .models import Account, Transaction
+
+from accounts import sharding
+from .models import IBAN_REGEX, Account, Transaction
 
 
 class AccountSerializer(serializers.ModelSerializer):
@@ -13,7 +16,39 @@ class AccountSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Account
-        fields = ['id', 'iban', 'balance']  # Fields to include in the serialized output
+        fields = ['id', 'iban', 'balance', 'currency']  # Fields to include in the serialized output
+        # IBAN uniqueness is checked on the account's shard by `validate_iban`
+        extra_kwargs = {
+            'iban': {'validators': [RegexValidator(regex=IBAN_REGEX, message='IBAN must be in the correct format')]}
+        }
+
+    def validate_iban(self, value):
+        """
+        Check that no other account has this IBAN on the shard it belongs to.
+
+        An account cannot be given an IBAN belonging to another shard, as that
+        would move it and its history to another database.
+        """
+        using = sharding.shard_for_iban(value)
+        accounts = Account.objects.using(using).filter(iban=value)
+        if self.instance is not None:
+            if using != self.instance._state.db:
+                raise serializers.ValidationError('IBAN cannot be changed to one held on another shard.')
+            accounts = accounts.exclude(pk=self.instance.pk)
+        if accounts.exists():
+            raise serializers.ValidationError('account with this iban already exists.')
+        return value
+
+    def validate_currency(self, value):
+        """
+        Check that the currency of an existing account is not changed.
+
+        The balance is stored as a plain amount, so changing the currency would
+        silently reinterpret it in another currency.
+        """
+        if self.instance is not None and value != self.instance.currency:
+            raise serializers.ValidationError('The currency of an account cannot be changed.')
+        return value
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -0,0 +1,133 @@
+import zlib
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+# Primary keys handed out by each shard start at its index times this span, so
+# that the shard holding an account, transaction or event follows from its ID
+SHARD_ID_SPAN = 10 ** 15
+
+# Models of the accounts app whose rows live on the shard of their account
+SHARDED_MODELS = {'account', 'transaction', 'outboxevent', 'transfersaga', 'scheduledtransfer', 'scheduledtransferrun'}
+
+# Models whose IDs are exposed by the API and must be unique across shards
+OFFSET_MODELS = ['Account', 'Transaction', 'OutboxEvent']
+
+
+def is_sharded(model):
+    """
+    Return whether the rows of `model` are spread across the account shards.
+    """
+    return model._meta.app_label == 'accounts' and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for_iban(iban):
+    """
+    Return the database alias of the shard an IBAN belongs to.
+
+    The shard is picked by hashing the IBAN, so that looking an account up by
+    IBAN queries a single shard rather than all of them.
+
+    Args:
+    iban (str): The IBAN of the account.
+
+    Returns:
+    str: The database alias of the shard.
+    """
+
+    shards = settings.ACCOUNT_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    return shards[zlib.crc32(iban.encode()) % len(shards)]
+
+
+def shard_for_pk(pk):
+    """
+    Return the database alias of the shard holding the account with the given ID.
+
+    IDs outside the range of every shard resolve to the first one, where the
+    lookup then finds nothing.
+
+    Args:
+    pk (int): The ID of the account.
+
+    Returns:
+    str: The database alias of the shard.
+    """
+
+    shards = settings.ACCOUNT_SHARDS
+    index = int(pk) // SHARD_ID_SPAN
+    if 0 < index < len(shards):
+        return shards[index]
+    return shards[0]
+
+
+def set_id_offset(alias):
+    """
+    Make the tables of a shard hand out IDs from the start of its range.
+
+    Rows already numbered past that start are left alone: the next ID is
+    always after the largest one in use.
+
+    Args:
+    alias (str): The database alias of the shard.
+    """
+
+    index = settings.ACCOUNT_SHARDS.index(alias)
+    if index == 0:
+        return
+    start = index * SHARD_ID_SPAN
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model_name in OFFSET_MODELS:
+            db_table = apps.get_model('accounts', model_name)._meta.db_table
+            table = connection.ops.quote_name(db_table)
+            cursor.execute(f'SELECT MAX(id) FROM {table}')
+            last = max(cursor.fetchone()[0] or 0, start)
+            if connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [db_table])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [db_table, last])
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, last])
+            elif connection.vendor == 'mysql':
+                cursor.execute(f'ALTER TABLE {table} AUTO_INCREMENT = {last + 1}')
+            else:
+                raise NotImplementedError(f'Cannot set the ID offset of a {connection.vendor} shard')
+
+
+class ShardRouter:
+    """
+    Database router spreading accounts across the databases in `ACCOUNT_SHARDS`.
+
+    A new account is written to the shard its IBAN hashes to, and a new row
+    belonging to an account to the shard of that account. Existing rows are
+    written back to the database they were read from. Reads are not routed:
+    callers pick the shard with `shard_for_pk` or `shard_for_iban` and
+    `QuerySet.using()`.
+
+    Only the tables of sharded models are created on databases other than the
+    default one, which also keeps exchange rates and the other apps.
+    """
+
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is None or not is_sharded(model) or not instance._state.adding:
+            return None
+        if model._meta.model_name == 'account':
+            return shard_for_iban(instance.iban)
+        account_id = getattr(instance, 'account_id', None) or getattr(instance, 'from_account_id', None)
+        if account_id is not None:
+            return shard_for_pk(account_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default':
+            return None
+        return app_label == 'accounts' and model_name in SHARDED_MODELS
@@ -0,0 +1,11 @@
+import re
+
+# Literals and savepoint names replaced by `?` so that queries differing only in IDs, amounts, dates or threads match
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bs\d+_x\d+\b")
+
+
+def normalize_sql(sql):
+    """
+    Replace the literals of a SQL statement with placeholders.
+    """
+    return LITERALS.sub('?', sql)
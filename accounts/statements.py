@@ -0,0 +1,260 @@
+import csv
+import datetime
+import hashlib
+import html
+import io
+import itertools
+import json
+import os
+from operator import itemgetter
+from pathlib import Path
+
+import django
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import Account, Transaction
+
+# Bump when the layout of rendered statements changes, so that the next run renders them all again
+LAYOUT_VERSION = 1
+
+# Content type of each statement format, keyed by file extension
+CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+}
+
+TRANSACTION_TYPES = dict(Transaction.TRANSACTION_TYPES)
+
+
+def month_bounds(month):
+    """
+    Return the start of a month and the start of the following one.
+
+    Args:
+    month (str): The month, as `YYYY-MM`.
+
+    Returns:
+    tuple: Two aware datetimes in the current time zone.
+
+    Raises:
+    ValueError: If `month` is not a valid `YYYY-MM` month.
+    """
+
+    start = datetime.datetime.strptime(month, '%Y-%m')
+    if f'{start:%Y-%m}' != month:
+        raise ValueError(f'Invalid month: {month}')
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return timezone.make_aware(start), timezone.make_aware(end)
+
+
+def iter_statements(month, using=None, chunk_size=2000):
+    """
+    Build the statement data of every account of a shard for a month.
+
+    The month's transactions of all accounts are streamed by a single query
+    ordered by account, fetched `chunk_size` rows at a time, and merged with
+    the accounts, streamed in the same order. Opening balances are derived
+    from the current balances and the sum of the transactions made since the
+    start of the month, both read by the same statement so that they come
+    from one consistent snapshot.
+
+    Args:
+    month (str): The month, as `YYYY-MM`.
+    using (str): The database alias of the account shard.
+    chunk_size (int): The number of rows fetched at a time.
+
+    Yields:
+    dict: The JSON-serializable data of one statement.
+    """
+
+    start, end = month_bounds(month)
+    total_since_start = (
+        Transaction.objects.using(using).filter(account=OuterRef('pk'), date__gte=start)
+        .order_by().values('account').annotate(total=Sum('amount')).values('total')
+    )
+    rows = itertools.groupby(
+        Transaction.objects.using(using).filter(date__gte=start, date__lt=end)
+        .order_by('account_id', 'date', 'id')
+        .values_list('account_id', 'date', 'transaction_type', 'amount')
+        .iterator(chunk_size=chunk_size),
+        key=itemgetter(0),
+    )
+    group = next(rows, None)
+    accounts = Account.objects.using(using).order_by('pk').annotate(since_start=Coalesce(
+        Subquery(total_since_start), Value(0), output_field=DecimalField(max_digits=15, decimal_places=2)
+    )).values_list('pk', 'iban', 'currency', 'balance', 'since_start')
+    for pk, iban, currency, balance, since_start in accounts.iterator(chunk_size=chunk_size):
+        while group is not None and group[0] < pk:
+            group = next(rows, None)
+        entries = []
+        if group is not None and group[0] == pk:
+            entries = list(group[1])
+            group = next(rows, None)
+
+        opening = balance - since_start
+        running = opening
+        lines = []
+        for _, date, transaction_type, amount in entries:
+            running += amount
+            lines.append([
+                timezone.localtime(date).isoformat(timespec='seconds'), TRANSACTION_TYPES[transaction_type],
+                str(amount), str(running),
+            ])
+        yield {
+            'account': pk,
+            'iban': iban,
+            'currency': currency,
+            'month': month,
+            'start': start.date().isoformat(),
+            'end': (end - datetime.timedelta(days=1)).date().isoformat(),
+            'opening_balance': str(opening),
+            'closing_balance': str(running),
+            'transactions': lines,
+        }
+
+
+def statement_digest(statement):
+    """
+    Return the SHA-256 digest of a statement's data and of the layout it is rendered with.
+    """
+    data = json.dumps([LAYOUT_VERSION, statement], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def render_text(statement):
+    """
+    Render a statement as plain text.
+    """
+    lines = [
+        f'Statement of account {statement["iban"]} ({statement["currency"]})',
+        f'Period: {statement["start"]} to {statement["end"]}',
+        '',
+        f'{"Date":<25} {"Type":<10} {"Amount":>15} {"Balance":>15}',
+        f'{statement["start"]:<25} {"Opening":<10} {"":>15} {statement["opening_balance"]:>15}',
+    ]
+    for date, transaction_type, amount, balance in statement['transactions']:
+        lines.append(f'{date:<25} {transaction_type:<10} {amount:>15} {balance:>15}')
+    lines.append(f'{statement["end"]:<25} {"Closing":<10} {"":>15} {statement["closing_balance"]:>15}')
+    return '\n'.join(lines) + '\n'
+
+
+def render_csv(statement):
+    """
+    Render a statement as CSV, with the opening and closing balances as the first and last rows.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['date', 'type', 'amount', 'balance'])
+    writer.writerow([statement['start'], 'Opening', '', statement['opening_balance']])
+    writer.writerows(statement['transactions'])
+    writer.writerow([statement['end'], 'Closing', '', statement['closing_balance']])
+    return output.getvalue()
+
+
+def render_html(statement):
+    """
+    Render a statement as a standalone HTML page.
+    """
+    def row(*cells):
+        return '<tr>' + ''.join(f'<td>{html.escape(cell)}</td>' for cell in cells) + '</tr>'
+
+    title = html.escape(f'Statement of account {statement["iban"]} ({statement["currency"]})')
+    rows = [row(statement['start'], 'Opening', '', statement['opening_balance'])]
+    rows.extend(row(*line) for line in statement['transactions'])
+    rows.append(row(statement['end'], 'Closing', '', statement['closing_balance']))
+    return (
+        f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{title}</title></head>\n<body>\n'
+        f'<h1>{title}</h1>\n<p>Period: {statement["start"]} to {statement["end"]}</p>\n'
+        '<table>\n<tr><th>Date</th><th>Type</th><th>Amount</th><th>Balance</th></tr>\n'
+        + '\n'.join(rows) + '\n</table>\n</body>\n</html>\n'
+    )
+
+
+# Renderer of each statement format, keyed by file extension
+RENDERERS = {
+    'txt': render_text,
+    'csv': render_csv,
+    'html': render_html,
+}
+
+
+def render_statement(statement, formats):
+    """
+    Render a statement in each of the given formats.
+
+    Args:
+    statement (dict): The statement data.
+    formats (list): The file extensions of the formats to render.
+
+    Returns:
+    dict: The encoded content of the statement, keyed by format.
+    """
+    return {fmt: RENDERERS[fmt](statement).encode() for fmt in formats}
+
+
+def render_in_worker(statement, formats):
+    """
+    Entry point for renderer worker processes.
+
+    Makes sure Django is set up when the process was spawned rather than forked.
+    """
+    django.setup()
+    return render_statement(statement, formats)
+
+
+class StatementStore:
+    """
+    Local file store of rendered statements.
+
+    A statement is stored as `<account>/<month>.<format>` under the root
+    directory, next to `<account>/<month>.sha256` holding the digest of the
+    data it was rendered from. A statement whose data has not changed since
+    it was rendered is not rendered again.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, account_id, month, fmt):
+        """
+        Return the path of a statement in the given format.
+        """
+        return self.root / str(account_id) / f'{month}.{fmt}'
+
+    def stale_formats(self, account_id, month, digest, formats):
+        """
+        Return the formats of a statement that must be rendered for the given data digest.
+        """
+        digest_path = self.path(account_id, month, 'sha256')
+        if not digest_path.exists() or digest_path.read_text() != digest:
+            return list(formats)
+        return [fmt for fmt in formats if not self.path(account_id, month, fmt).exists()]
+
+    def save(self, account_id, month, digest, rendered):
+        """
+        Write the rendered formats of a statement, then its digest.
+
+        Files are replaced atomically, so that the endpoint never serves a
+        partly written statement. Formats rendered from older data and not
+        rendered again are removed.
+        """
+        digest_path = self.path(account_id, month, 'sha256')
+        digest_path.parent.mkdir(parents=True, exist_ok=True)
+        if digest_path.exists() and digest_path.read_text() != digest:
+            for fmt in RENDERERS:
+                if fmt not in rendered:
+                    self.path(account_id, month, fmt).unlink(missing_ok=True)
+        for fmt, content in rendered.items():
+            self.write(self.path(account_id, month, fmt), content)
+        self.write(digest_path, digest.encode())
+
+    def write(self, path, content):
+        """
+        Write a file through a temporary file renamed over it.
+        """
+        temporary = path.with_name(f'.{path.name}.tmp')
+        temporary.write_bytes(content)
+        os.replace(temporary, path)
@@ -0,0 +1,75 @@
+import difflib
+import json
+import os
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from accounts.sql import normalize_sql
+
+# Recorded SQL of every endpoint, keyed by URL name
+QUERY_SNAPSHOTS = Path(__file__).resolve().parent / 'query_snapshots.json'
+
+# Set UPDATE_QUERY_SNAPSHOTS=1 to record the current queries instead of checking them
+UPDATE_QUERY_SNAPSHOTS = os.environ.get('UPDATE_QUERY_SNAPSHOTS') == '1'
+
+
+class QueryBudgetMixin:
+    """
+    Test case mixin pinning the SQL queries run by a block of code.
+
+    Queries are recorded on every account shard in `ACCOUNT_SHARDS`, those
+    sent to another shard than the default one being prefixed with its alias.
+    They are compared with the snapshot recorded under a name in
+    `query_snapshots.json`: running a different number of queries fails with a
+    diff of the recorded and the actual queries, and any query slower than
+    `max_query_time` seconds fails with its SQL.
+    """
+
+    max_query_time = 0.05
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.query_snapshots = json.loads(QUERY_SNAPSHOTS.read_text()) if QUERY_SNAPSHOTS.exists() else {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_QUERY_SNAPSHOTS:
+            QUERY_SNAPSHOTS.write_text(json.dumps(cls.query_snapshots, indent=2, sort_keys=True) + '\n')
+        super().tearDownClass()
+
+    @contextmanager
+    def assertQueryBudget(self, name):
+        """
+        Check the queries run inside the block against the snapshot recorded as `name`.
+        """
+        with ExitStack() as stack:
+            contexts = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.ACCOUNT_SHARDS
+            }
+            yield
+        queries = [
+            dict(query, sql=query['sql'] if alias == 'default' else f'{alias}: {query["sql"]}')
+            for alias, context in contexts.items() for query in context.captured_queries
+        ]
+        actual = [normalize_sql(query['sql']) for query in queries]
+
+        if UPDATE_QUERY_SNAPSHOTS:
+            self.query_snapshots[name] = actual
+            return
+        if name not in self.query_snapshots:
+            self.fail(f'No query snapshot for {name}; record one with UPDATE_QUERY_SNAPSHOTS=1')
+
+        expected = self.query_snapshots[name]
+        if len(actual) != len(expected):
+            diff = '\n'.join(difflib.unified_diff(expected, actual, 'recorded', 'actual', lineterm=''))
+            self.fail(f'{name} ran {len(actual)} queries instead of {len(expected)}:\n{diff}')
+
+        slowest = max(queries, key=lambda query: float(query['time']), default=None)
+        if slowest is not None and float(slowest['time']) > self.max_query_time:
+            self.fail(f'{name} ran a query in {slowest["time"]}s (limit {self.max_query_time}s):\n{slowest["sql"]}')
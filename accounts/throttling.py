@@ -0,0 +1,154 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Token bucket state is kept in integer microseconds so that it can be updated with `cache.incr`
+MICROSECONDS = 1_000_000
+
+# Length in seconds of the periods accepted in throttle rates
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class for token bucket throttles backed by the Django cache.
+
+    A rate of `N/period` gives every client a bucket of N tokens refilled at
+    N tokens per period. The bucket is stored as a single integer, the
+    theoretical arrival time of the next request (GCRA), which every request
+    advances with an atomic `cache.incr`; a rejected request gives its token
+    back with `cache.decr`.
+
+    Reads (GET, HEAD, OPTIONS) and writes use separate budgets, configured in
+    `DEFAULT_THROTTLE_RATES` as `<scope_prefix>_read` and `<scope_prefix>_write`.
+    A scope without a rate is not throttled.
+    """
+
+    scope_prefix = None
+
+    def __init__(self):
+        # Resolve the cache once per request rather than on every cache operation
+        self.cache = caches[settings.THROTTLE_CACHE]
+
+    def get_ident_for(self, request, view):
+        """
+        Return the identity the bucket belongs to, or None to skip throttling.
+        """
+        raise NotImplementedError('.get_ident_for() must be overridden')
+
+    def get_scope(self, request):
+        """
+        Return the throttle scope of the request, depending on whether it reads or writes.
+        """
+        kind = 'read' if request.method in SAFE_METHODS else 'write'
+        return f'{self.scope_prefix}_{kind}'
+
+    def parse_rate(self, rate):
+        """
+        Parse a rate such as `100/min` into a number of requests and a period in seconds.
+        """
+        num, period = rate.split('/')
+        return int(num), PERIODS[period[0]]
+
+    def allow_request(self, request, view):
+        """
+        Take a token from the client's bucket, returning False if the bucket is empty.
+        """
+        scope = self.get_scope(request)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        ident = self.get_ident_for(request, view)
+        if ident is None:
+            return True
+
+        capacity, duration = self.parse_rate(rate)
+        emission = duration * MICROSECONDS // capacity
+        tolerance = capacity * emission
+        # Idents hold client-chosen values: hash them into keys any cache backend accepts
+        key = f'throttle:{scope}:{hashlib.sha256(str(ident).encode()).hexdigest()}'
+        now = int(time.time() * MICROSECONDS)
+
+        try:
+            tat = self.cache.incr(key, emission)
+        except ValueError:
+            # First request of this client: start with a full bucket
+            if self.cache.add(key, now + emission, duration):
+                return True
+            tat = self.cache.incr(key, emission)
+
+        if tat - emission < now:
+            # The bucket refilled completely while the client was idle. Restarting
+            # the clock is not atomic, but a race can only let a request through.
+            self.cache.set(key, now + emission, duration)
+            return True
+        if tat - now <= tolerance:
+            self.cache.touch(key, duration)
+            return True
+
+        self.cache.decr(key, emission)
+        self.wait_seconds = (tat - tolerance - now) / MICROSECONDS
+        return False
+
+    def wait(self):
+        """
+        Return the number of seconds until the next token is available, sent as `Retry-After`.
+        """
+        return self.wait_seconds
+
+
+class ApiKeyRateThrottle(TokenBucketThrottle):
+    """
+    Throttle keyed by the client's API key. Requests without one are not throttled here.
+
+    API keys are chosen by the client, so this throttle only splits the budget
+    of well-behaved clients; `IpRateThrottle` bounds the clients rotating keys.
+    """
+
+    scope_prefix = 'api_key'
+
+    def get_ident_for(self, request, view):
+        api_key = request.META.get(settings.THROTTLE_API_KEY_HEADER)
+        if api_key:
+            return f'key:{api_key}'
+        return None
+
+
+class IpRateThrottle(TokenBucketThrottle):
+    """
+    Throttle keyed by the client's IP address, applied whether or not it sends an API key.
+
+    The address is the peer address, or the one the last of `NUM_PROXIES`
+    reverse proxies saw in `X-Forwarded-For`.
+    """
+
+    scope_prefix = 'ip'
+
+    def get_ident_for(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class AccountRateThrottle(TokenBucketThrottle):
+    """
+    Throttle keyed by the account an endpoint operates on.
+
+    The account is the one in the URL, or the sending IBAN for transfers.
+    Endpoints that are not about a single account are not throttled.
+    """
+
+    scope_prefix = 'account'
+
+    def get_ident_for(self, request, view):
+        pk = view.kwargs.get('pk')
+        if pk is not None:
+            return f'pk:{pk}'
+        if request.method not in SAFE_METHODS and isinstance(request.data, dict):
+            from_iban = request.data.get('from_iban')
+            if from_iban:
+                return f'iban:{from_iban}'
+        return None
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import AccountListCreateView, AccountDetailView, deposit, withdraw, transfer, TransactionListView
+from .views import AccountListCreateView, AccountDetailView, deposit, withdraw, transfer, TransactionListView, \
+    account_events, account_statement
 
 urlpatterns = [
     # URL pattern for listing all accounts or creating a new account
@@ -19,4 +20,10 @@ urlpatterns = [
 
     # URL pattern for listing all transactions for a specific account by its primary key (ID)
     path('accounts/<int:pk>/transactions/', TransactionListView.as_view(), name='transaction-list'),
+
+    # URL pattern for long-polling the ledger events of a specific account by its primary key (ID)
+    path('accounts/<int:pk>/events/', account_events, name='account-events'),
+
+    # URL pattern for downloading the statement of a specific account by its primary key (ID) for a month (YYYY-MM)
+    path('accounts/<int:pk>/statements/<str:month>/', account_statement, name='account-statement'),
 ]
@@ -1,13 +1,25 @@
+import base64
+import binascii
 import decimal
+import heapq
+import itertools
+import json
+import math
+import time
 
-from rest_framework import generics, pagination
+from rest_framework import exceptions, generics, pagination
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.http import FileResponse
 from django_filters import rest_framework as filters
 
-from accounts.models import Account, Transaction
+from accounts import group_commit, ledger, sagas, sharding, statements
+from accounts.docs import openapi, swagger_auto_schema
+from accounts.models import Account, Transaction, OutboxEvent
 from accounts.serializers import AccountSerializer, TransactionSerializer
 
 
@@ -63,21 +75,282 @@ class CustomPageNumberPagination(pagination.PageNumberPagination):
         return f"{url}?{query_params.urlencode()}"
 
 
+class KeysetPagination(pagination.BasePagination):
+    """
+    Keyset (seek) pagination for large tables.
+
+    Each page is fetched with a single indexed range query starting after the
+    last row of the previous page, which is passed back as an opaque `cursor`.
+    Unlike page numbers, this never counts the table nor skips over rows with
+    an OFFSET, so every page costs the same however deep it is.
+
+    Orderings map to the columns of the keyset, ending with the primary key
+    so that the position of every row is unique.
+
+    Sharded tables are paginated across every shard: each one is asked for a
+    page and the pages are merged in the requested ordering.
+    """
+
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    orderings = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'balance': ('balance', 'id'),
+        '-balance': ('-balance', '-id'),
+    }
+    default_ordering = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return the page of rows following the cursor, in the requested ordering.
+        """
+        self.request = request
+        self.ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if self.ordering not in self.orderings:
+            raise exceptions.ValidationError({'ordering': f'Must be one of {", ".join(self.orderings)}'})
+        fields = self.orderings[self.ordering]
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = self.decode_cursor(cursor, queryset.model, fields)
+            try:
+                queryset = queryset.filter(self.get_seek_filter(fields, position))
+            except (ValueError, TypeError, ValidationError):
+                raise exceptions.NotFound('Invalid cursor')
+
+        page_size = self.get_page_size(request)
+        if sharding.is_sharded(queryset.model):
+            aliases = settings.ACCOUNT_SHARDS
+        else:
+            aliases = [queryset.db]
+        pages = [list(queryset.using(alias).order_by(*fields)[:page_size + 1]) for alias in aliases]
+        if len(pages) == 1:
+            rows = pages[0]
+        else:
+            rows = list(itertools.islice(heapq.merge(*pages, key=self.get_sort_key(fields)), page_size + 1))
+        page = rows[:page_size]
+        self.next_position = None
+        if len(rows) > page_size:
+            last = page[-1]
+            self.next_position = [str(getattr(last, field.lstrip('-'))) for field in fields]
+        return page
+
+    def get_paginated_response(self, data):
+        """
+        Return the page with a link to the next one, if any.
+        """
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+    def get_page_size(self, request):
+        """
+        Return the requested page size, capped at `max_page_size`.
+        """
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_sort_key(self, fields):
+        """
+        Build the function returning the sort key of a row in the ordering given by `fields`.
+        """
+        def sort_key(row):
+            return tuple(
+                -getattr(row, field[1:]) if field.startswith('-') else getattr(row, field) for field in fields
+            )
+        return sort_key
+
+    def get_seek_filter(self, fields, position):
+        """
+        Build the filter selecting the rows after `position` in the ordering given by `fields`.
+
+        For `('balance', 'id')` this is `balance > b OR (balance = b AND id > i)`,
+        which the database answers with a range scan of the matching index.
+        """
+        seek = Q()
+        equal = Q()
+        for field, value in zip(fields, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def encode_cursor(self, position):
+        """
+        Encode a keyset position as an opaque URL-safe cursor.
+        """
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor, model, fields):
+        """
+        Decode a cursor back into a keyset position.
+
+        Each value is checked against its model field, e.g. an integer for `id`
+        and a decimal with two places for `balance`.
+
+        Args:
+        cursor (str): The cursor, as found in the query string.
+        model (Model): The paginated model.
+        fields (tuple): The fields of the ordering the cursor was issued for.
+
+        Returns:
+        list: The value of each field at the position, as Python values.
+        """
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(position, list) or len(position) != len(fields):
+                raise ValueError(cursor)
+            if not all(isinstance(value, str) for value in position):
+                raise ValueError(cursor)
+            return [
+                model._meta.get_field(field.lstrip('-')).clean(value, None) for field, value in zip(fields, position)
+            ]
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise exceptions.NotFound('Invalid cursor')
+
+    def get_next_link(self):
+        """
+        Generate a link to the next page, keeping the other query parameters.
+        """
+        if self.next_position is None:
+            return None
+        query_params = self.request.query_params.copy()
+        query_params[self.cursor_query_param] = self.encode_cursor(self.next_position)
+        return self.request.build_absolute_uri(f"{self.request.path}?{query_params.urlencode()}")
+
+
+def ledger_response(outcome, success):
+    """
+    Build the response for the outcome of a ledger operation.
+
+    Args:
+    outcome (str): The outcome message returned by the ledger.
+    success (str): The outcome message meaning the operation succeeded.
+
+    Returns:
+    Response: 200 on success, 404 for an unknown account and 400 otherwise.
+    """
+    if outcome == success:
+        return Response({'status': outcome})
+    elif outcome == ledger.ACCOUNT_NOT_FOUND:
+        return Response({'status': outcome}, status=404)
+    else:
+        return Response({'status': outcome}, status=400)
+
+
+def parse_amount(value):
+    """
+    Parse the amount of a ledger operation from the request data.
+
+    JSON numbers are parsed from their text, so that `10.1` is not read as
+    the nearest binary float.
+
+    Args:
+    value: The `amount` of the request data.
+
+    Returns:
+    Decimal: The amount, or None if it is missing, malformed or cannot be applied.
+    """
+    try:
+        amount = decimal.Decimal(str(value))
+    except decimal.InvalidOperation:
+        return None
+    return amount if ledger.is_valid_amount(amount) else None
+
+
+def iban_prefix_filter(prefix, vendor):
+    """
+    Build a filter matching the IBANs that start with `prefix`.
+
+    SQLite compares text byte by byte, so there the prefix is expressed as a
+    range, `prefix <= iban < next prefix`, which its unique index on `iban`
+    serves; its LIKE is case-insensitive and could not use that index. Other
+    databases usually compare text in a linguistic collation, where
+    punctuation such as the character following a final digit or `Z` sorts
+    before digits and letters and the range would miss every match. They get
+    `LIKE 'prefix%'` instead, which PostgreSQL serves with the
+    `varchar_pattern_ops` index Django creates next to the unique one.
+
+    Args:
+    prefix (str): The IBAN prefix, in any case.
+    vendor (str): The vendor of the database backend, e.g. `sqlite` or `postgresql`.
+
+    Returns:
+    Q: The filter.
+    """
+    prefix = prefix.upper()
+    if vendor == 'sqlite':
+        return Q(iban__gte=prefix, iban__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+    return Q(iban__startswith=prefix)
+
+
+class AccountFilter(filters.FilterSet):
+    """
+    Filter for searching accounts by IBAN prefix, country and balance range.
+    """
+
+    iban_prefix = filters.CharFilter(method='filter_iban_prefix', max_length=34)
+    country = filters.CharFilter(method='filter_iban_prefix', min_length=2, max_length=2)
+    min_balance = filters.NumberFilter(field_name='balance', lookup_expr='gte')
+    max_balance = filters.NumberFilter(field_name='balance', lookup_expr='lte')
+
+    class Meta:
+        model = Account
+        fields = ['iban_prefix', 'country', 'min_balance', 'max_balance']
+
+    def filter_iban_prefix(self, queryset, name, value):
+        """
+        Filter by IBAN prefix; the country code is the first two characters of the IBAN.
+        Every account shard runs on the same database backend as the default one.
+        """
+        return queryset.filter(iban_prefix_filter(value, connections[queryset.db].vendor))
+
+
 class AccountListCreateView(generics.ListCreateAPIView):
     """
-    View for listing and creating accounts.
+    View for searching, listing and creating accounts.
 
-    GET: Retrieve a list of accounts.
+    GET: Retrieve a list of accounts with optional filters and ordering, using keyset pagination.
     POST: Create a new account.
     """
 
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
-    pagination_class = CustomPageNumberPagination
+    filter_backends = (filters.DjangoFilterBackend,)
+    filterset_class = AccountFilter
+    pagination_class = KeysetPagination
 
     @swagger_auto_schema(
-        operation_description="Retrieve a list of accounts or create a new account",
-        responses={200: AccountSerializer(many=True)}
+        operation_description="Retrieve a list of accounts with optional filters and ordering, using keyset "
+                              "pagination. Follow the `next` link to get the following page.",
+        responses={200: AccountSerializer(many=True)},
+        manual_parameters=[
+            openapi.Parameter('iban_prefix', openapi.IN_QUERY, description="Filter by IBAN prefix (e.g., 'DE89')",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('country', openapi.IN_QUERY, description="Filter by IBAN country code (e.g., 'DE')",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('min_balance', openapi.IN_QUERY, description="Filter by minimum balance",
+                              type=openapi.TYPE_NUMBER),
+            openapi.Parameter('max_balance', openapi.IN_QUERY, description="Filter by maximum balance",
+                              type=openapi.TYPE_NUMBER),
+            openapi.Parameter('ordering', openapi.IN_QUERY, description="Order by 'id', '-id', 'balance' or "
+                              "'-balance'", type=openapi.TYPE_STRING, example='-balance'),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor taken from the `next` link",
+                              type=openapi.TYPE_STRING),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Number of items per page",
+                              type=openapi.TYPE_INTEGER, example=10),
+        ]
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
@@ -100,9 +373,14 @@ class AccountDetailView(generics.RetrieveUpdateDestroyAPIView):
     DELETE: Delete an account.
     """
 
-    queryset = Account.objects.all()
     serializer_class = AccountSerializer
 
+    def get_queryset(self):
+        """
+        Look the account up on the shard its ID belongs to.
+        """
+        return Account.objects.using(sharding.shard_for_pk(self.kwargs['pk']))
+
     @swagger_auto_schema(
         operation_description="Retrieve, update, or delete an account by ID",
         responses={200: AccountSerializer}
@@ -121,7 +399,7 @@ class AccountDetailView(generics.RetrieveUpdateDestroyAPIView):
         },
         required=['amount']
     ),
-    responses={200: 'Deposit successful', 400: 'Invalid amount'}
+    responses={200: 'Deposit successful', 400: 'Invalid amount', 404: 'Account not found'}
 )
 @api_view(['POST'])
 def deposit(request, pk):
@@ -135,14 +413,14 @@ def deposit(request, pk):
     Response: Success or error message.
     """
 
-    account = Account.objects.get(pk=pk)
-    amount = decimal.Decimal(request.data.get('amount'))
-    if amount <= 0:
-        return Response({'status': 'Invalid amount'}, status=400)
-    account.balance += amount
-    account.save()
-    Transaction.objects.create(account=account, amount=amount, transaction_type=Transaction.DEPOSIT)
-    return Response({'status': 'Deposit successful'})
+    amount = parse_amount(request.data.get('amount'))
+    if amount is None:
+        return Response({'status': ledger.INVALID_AMOUNT}, status=400)
+    if settings.LEDGER_GROUP_COMMIT:
+        outcome = group_commit.get_writer(sharding.shard_for_pk(pk)).submit(Transaction.DEPOSIT, pk, None, amount)
+    else:
+        outcome = ledger.deposit(pk, amount)
+    return ledger_response(outcome, ledger.DEPOSIT_SUCCESS)
 
 
 @swagger_auto_schema(
@@ -155,7 +433,7 @@ def deposit(request, pk):
         },
         required=['amount']
     ),
-    responses={200: 'Withdrawal successful', 400: 'Insufficient funds or Invalid amount'}
+    responses={200: 'Withdrawal successful', 400: 'Insufficient funds or Invalid amount', 404: 'Account not found'}
 )
 @api_view(['POST'])
 def withdraw(request, pk):
@@ -169,17 +447,14 @@ def withdraw(request, pk):
     Response: Success or error message.
     """
 
-    account = Account.objects.get(pk=pk)
-    amount = decimal.Decimal(request.data.get('amount'))
-    if amount <= 0:
-        return Response({'status': 'Invalid amount'}, status=400)
-    if account.balance >= amount:
-        account.balance -= amount
-        account.save()
-        Transaction.objects.create(account=account, amount=-amount, transaction_type=Transaction.WITHDRAWAL)
-        return Response({'status': 'Withdrawal successful'})
+    amount = parse_amount(request.data.get('amount'))
+    if amount is None:
+        return Response({'status': ledger.INVALID_AMOUNT}, status=400)
+    if settings.LEDGER_GROUP_COMMIT:
+        outcome = group_commit.get_writer(sharding.shard_for_pk(pk)).submit(Transaction.WITHDRAWAL, pk, None, amount)
     else:
-        return Response({'status': 'Insufficient funds'}, status=400)
+        outcome = ledger.withdraw(pk, amount)
+    return ledger_response(outcome, ledger.WITHDRAWAL_SUCCESS)
 
 
 @swagger_auto_schema(
@@ -190,11 +465,13 @@ def withdraw(request, pk):
         properties={
             'from_iban': openapi.Schema(type=openapi.TYPE_STRING, description='IBAN of the sender account'),
             'to_iban': openapi.Schema(type=openapi.TYPE_STRING, description='IBAN of the receiver account'),
-            'amount': openapi.Schema(type=openapi.TYPE_NUMBER, description='Amount to transfer')
+            'amount': openapi.Schema(type=openapi.TYPE_NUMBER,
+                                     description='Amount to transfer, in the currency of the sender account')
         },
         required=['from_iban', 'to_iban', 'amount']
     ),
-    responses={200: 'Transfer successful', 400: 'Insufficient funds or Invalid amount', 404: 'Account not found'}
+    responses={200: 'Transfer successful', 400: 'Insufficient funds, Invalid amount or Exchange rate not available',
+               404: 'Account not found'}
 )
 @api_view(['POST'])
 def transfer(request):
@@ -207,25 +484,28 @@ def transfer(request):
 
     from_iban = request.data.get('from_iban')
     to_iban = request.data.get('to_iban')
-    amount = decimal.Decimal(request.data.get('amount'))
-    if amount <= 0:
-        return Response({'status': 'Invalid amount'}, status=400)
+    amount = parse_amount(request.data.get('amount'))
+    if amount is None:
+        return Response({'status': ledger.INVALID_AMOUNT}, status=400)
+    # Only strings can be hashed to a shard, and no account has any other IBAN
+    if not all(isinstance(iban, str) and iban for iban in (from_iban, to_iban)):
+        return Response({'status': 'Account not found'}, status=404)
     try:
-        from_account = Account.objects.get(iban=from_iban)
-        to_account = Account.objects.get(iban=to_iban)
+        # Each IBAN hashes to the only shard that can hold it
+        from_account = Account.objects.using(sharding.shard_for_iban(from_iban)).get(iban=from_iban)
+        to_account = Account.objects.using(sharding.shard_for_iban(to_iban)).get(iban=to_iban)
     except Account.DoesNotExist:
         return Response({'status': 'Account not found'}, status=404)
 
-    if from_account.balance >= amount:
-        from_account.balance -= amount
-        to_account.balance += amount
-        from_account.save()
-        to_account.save()
-        Transaction.objects.create(account=from_account, amount=-amount, transaction_type=Transaction.TRANSFER)
-        Transaction.objects.create(account=to_account, amount=amount, transaction_type=Transaction.TRANSFER)
-        return Response({'status': 'Transfer successful'})
+    using = from_account._state.db
+    if using != to_account._state.db:
+        outcome = sagas.transfer_across_shards(from_account, to_account, amount)
+    # The ledger converts cross-currency transfers in the same atomic write
+    elif settings.LEDGER_GROUP_COMMIT:
+        outcome = group_commit.get_writer(using).submit(Transaction.TRANSFER, from_account.pk, to_account.pk, amount)
     else:
-        return Response({'status': 'Insufficient funds'}, status=400)
+        outcome, = ledger.apply_transfers([(from_account.pk, to_account.pk, amount)], using)
+    return ledger_response(outcome, ledger.TRANSFER_SUCCESS)
 
 
 class TransactionFilter(filters.FilterSet):
@@ -285,4 +565,107 @@ class TransactionListView(generics.ListAPIView):
         Override to filter transactions by the specific account ID.
         """
         account_id = self.kwargs['pk']
-        return Transaction.objects.filter(account_id=account_id)
+        return Transaction.objects.using(sharding.shard_for_pk(account_id)).filter(account_id=account_id)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Long-poll the ledger events of an account. Returns as soon as events newer than "
+                          "`after` exist, or an empty list once the timeout expires.",
+    manual_parameters=[
+        openapi.Parameter('after', openapi.IN_QUERY, description="Return events with an ID greater than this one",
+                          type=openapi.TYPE_INTEGER, example=0),
+        openapi.Parameter('timeout', openapi.IN_QUERY, description="Seconds to wait for new events",
+                          type=openapi.TYPE_NUMBER, example=25),
+    ],
+    responses={200: 'List of events and the ID to pass as `after` next', 400: 'Invalid parameters',
+               404: 'Account not found'}
+)
+@api_view(['GET'])
+def account_events(request, pk):
+    """
+    View for long-polling the ledger events of an account from the outbox.
+
+    `after` is a cursor on event IDs, which is only safe because the events
+    of one account commit in ID order: every ledger write inserts its events
+    while holding the lock on the account row, so a write cannot allocate a
+    lower ID and commit after a later one. Events of different accounts may
+    commit out of ID order, which is why there is no cursor across accounts.
+    Any new code writing events must keep holding the account lock.
+
+    Args:
+    pk (int): The ID of the account.
+
+    Returns:
+    Response: The events newer than `after` and the last event ID, or an error message.
+    """
+
+    try:
+        after = int(request.query_params.get('after', 0))
+        timeout = float(request.query_params.get('timeout', settings.OUTBOX_LONG_POLL_TIMEOUT))
+    except ValueError:
+        return Response({'status': 'Invalid parameters'}, status=400)
+    # NaN would compare false with every deadline and poll forever
+    if not math.isfinite(timeout):
+        return Response({'status': 'Invalid parameters'}, status=400)
+    timeout = min(max(timeout, 0), settings.OUTBOX_LONG_POLL_TIMEOUT)
+    using = sharding.shard_for_pk(pk)
+    if not Account.objects.using(using).filter(pk=pk).exists():
+        return Response({'status': 'Account not found'}, status=404)
+
+    deadline = time.monotonic() + timeout
+    while True:
+        events = list(
+            OutboxEvent.objects.using(using).filter(account_id=pk, id__gt=after)
+            .order_by('id')[:settings.OUTBOX_EVENTS_PAGE_SIZE]
+        )
+        if events or time.monotonic() >= deadline:
+            break
+        time.sleep(settings.OUTBOX_POLL_INTERVAL)
+
+    return Response({
+        'events': [event.to_message() for event in events],
+        'last_id': events[-1].pk if events else after,
+    })
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Download the monthly statement of an account, as generated by the "
+                          "`generate_statements` command.",
+    manual_parameters=[
+        openapi.Parameter('type', openapi.IN_QUERY, description="Statement format: 'txt', 'csv' or 'html'",
+                          type=openapi.TYPE_STRING, example='txt'),
+    ],
+    responses={200: 'The statement file', 400: 'Invalid month or statement type',
+               404: 'Account or statement not found'}
+)
+@api_view(['GET'])
+def account_statement(request, pk, month):
+    """
+    View for downloading the monthly statement of an account from the statement store.
+
+    Args:
+    pk (int): The ID of the account.
+    month (str): The month of the statement, as `YYYY-MM`.
+
+    Returns:
+    FileResponse: The statement, or a Response with an error message.
+    """
+
+    fmt = request.query_params.get('type', 'txt')
+    if fmt not in statements.RENDERERS:
+        return Response({'status': 'Invalid statement type'}, status=400)
+    try:
+        statements.month_bounds(month)
+    except ValueError:
+        return Response({'status': 'Invalid month'}, status=400)
+    if not Account.objects.using(sharding.shard_for_pk(pk)).filter(pk=pk).exists():
+        return Response({'status': 'Account not found'}, status=404)
+
+    path = statements.StatementStore(settings.STATEMENTS_ROOT).path(pk, month, fmt)
+    if not path.exists():
+        return Response({'status': 'Statement not found'}, status=404)
+    return FileResponse(
+        open(path, 'rb'), content_type=statements.CONTENT_TYPES[fmt], filename=f'statement-{pk}-{month}.{fmt}'
+    )
@@ -0,0 +1,11 @@
+from drf_yasg import openapi
+
+# API information shown in the Swagger UI and written to the generated OpenAPI schema
+api_info = openapi.Info(
+    title="Bank Account API",
+    default_version='v1',
+    description="API documentation for the Bank Account Kata challenge",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="BSD License"),
+)
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,10 +25,28 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-a4n92@%$y7k#x@wzz2!lgr-l*r2y$bkj*0*uh&0_!b2f47x93s'
 
+# Production mode serves a lean, stateless JSON API: no admin, no Swagger UI,
+# no sessions or messages, and only the middleware such an API needs.
+# Enable it with BANK_ACCOUNT_PRODUCTION=1.
+PRODUCTION = os.environ.get('BANK_ACCOUNT_PRODUCTION') == '1'
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
 ALLOWED_HOSTS = []
+if PRODUCTION:
+    # Comma-separated host names served in production; without any, every request would fail with a 400
+    ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+    if not ALLOWED_HOSTS:
+        raise ImproperlyConfigured('DJANGO_ALLOWED_HOSTS must list the served host names in production mode')
+
+# Serve the Swagger UI and the admin site (development only)
+API_DOCS_ENABLED = not PRODUCTION
+ADMIN_ENABLED = not PRODUCTION
+
+# Pre-generated OpenAPI schema served at /openapi.json when the Swagger UI is disabled.
+# Generate it in development mode with: python manage.py generate_swagger -o openapi.json
+OPENAPI_SCHEMA_FILE = BASE_DIR / 'openapi.json'
 
 
 # Application definition
@@ -52,6 +73,19 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if PRODUCTION:
+    # Drop the apps and middleware that only serve the admin, the Swagger UI and browser sessions
+    INSTALLED_APPS = [
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'rest_framework',
+        'accounts',
+    ]
+    MIDDLEWARE = [
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+
 ROOT_URLCONF = 'bank_account.urls'
 
 TEMPLATES = [
@@ -83,6 +117,21 @@ DATABASES = {
     }
 }
 
+# Accounts, with their transactions, outbox events and scheduled transfers, are
+# spread across these database aliases by `accounts.sharding.ShardRouter`. The
+# default database is shard 0 and also holds exchange rates and the other apps.
+# ACCOUNT_SHARD_COUNT=N adds N - 1 local SQLite shards; create their tables with
+# `python manage.py migrate_shards`.
+ACCOUNT_SHARDS = ['default']
+for index in range(1, int(os.environ.get('ACCOUNT_SHARD_COUNT', '1'))):
+    DATABASES[f'shard{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard{index}.sqlite3',
+    }
+    ACCOUNT_SHARDS.append(f'shard{index}')
+
+DATABASE_ROUTERS = ['accounts.sharding.ShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -131,4 +180,84 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # Token buckets per client IP, per API key and per account, with separate read and write budgets.
+    # API keys are not authenticated, so the per-IP budget applies to every request.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'accounts.throttling.IpRateThrottle',
+        'accounts.throttling.ApiKeyRateThrottle',
+        'accounts.throttling.AccountRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'ip_read': '1200/min',
+        'ip_write': '300/min',
+        'api_key_read': '1200/min',
+        'api_key_write': '300/min',
+        'account_read': '600/min',
+        'account_write': '60/min',
+    },
+    # Number of reverse proxies in front of the application. The client IP of the throttles is
+    # taken from X-Forwarded-For only past that many proxies, as clients can send any value.
+    'NUM_PROXIES': int(os.environ.get('DJANGO_NUM_PROXIES', '0')),
 }
+
+# Request header carrying the client's API key, as found in request.META
+THROTTLE_API_KEY_HEADER = 'HTTP_X_API_KEY'
+
+# Cache holding the token buckets. The default local-memory cache is per process:
+# point this at a shared cache (e.g. Redis or Memcached) when running several workers.
+THROTTLE_CACHE = 'default'
+
+if PRODUCTION:
+    # JSON only, and no session or basic authentication to run on every request
+    REST_FRAMEWORK.update({
+        'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+        'DEFAULT_AUTHENTICATION_CLASSES': [],
+        'UNAUTHENTICATED_USER': None,
+    })
+
+# drf-yasg configuration, used by the Swagger UI and by `manage.py generate_swagger`
+SWAGGER_SETTINGS = {
+    'DEFAULT_INFO': 'bank_account.api_info.api_info',
+}
+
+# Seconds between two checks of the exchange rate table version by the in-process FX cache
+FX_RATES_REFRESH_INTERVAL = 60
+
+# Longest time, in seconds, `GET /api/accounts/<pk>/events/` waits for new events
+OUTBOX_LONG_POLL_TIMEOUT = 25
+
+# Seconds between two checks of the outbox while a long-poll request waits
+OUTBOX_POLL_INTERVAL = 0.5
+
+# Maximum number of events returned by one long-poll request
+OUTBOX_EVENTS_PAGE_SIZE = 100
+
+# Directory the `generate_statements` command writes monthly statements to, and
+# `GET /api/accounts/<pk>/statements/<yyyy-mm>/` serves them from
+STATEMENTS_ROOT = BASE_DIR / 'statements'
+
+# Group commit: queue deposits, withdrawals and transfers to an in-process writer that
+# applies up to LEDGER_GROUP_COMMIT_MAX_BATCH of them, gathered for at most
+# LEDGER_GROUP_COMMIT_MAX_DELAY seconds, in a single database transaction
+LEDGER_GROUP_COMMIT = os.environ.get('LEDGER_GROUP_COMMIT') == '1'
+LEDGER_GROUP_COMMIT_MAX_BATCH = 100
+LEDGER_GROUP_COMMIT_MAX_DELAY = 0.002
+
+# Profiling: with BANK_ACCOUNT_PROFILING=1, requests of the URL names in PROFILING_RULES are
+# profiled and saved to PROFILING_DIR, one in `sample_every` of them and those taking
+# `slower_than` seconds or more. Summarize the captures with `python manage.py profile_report`.
+PROFILING_ENABLED = os.environ.get('BANK_ACCOUNT_PROFILING') == '1'
+PROFILING_RULES = {
+    'transaction-list': {'sample_every': 100, 'slower_than': 0.5},
+    'account-transfer': {'sample_every': 100, 'slower_than': 0.5},
+}
+
+# 'collapsed' samples the stack every PROFILING_SAMPLE_INTERVAL seconds, cheap enough for
+# `slower_than` rules, which profile every request; 'cprofile' traces every function call
+PROFILING_FORMAT = 'collapsed'
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+if PROFILING_ENABLED:
+    # Outermost, so that profiles also cover the other middleware's handling of the response
+    MIDDLEWARE = ['accounts.profiling.ProfilingMiddleware'] + MIDDLEWARE
@@ -0,0 +1,16 @@
+"""
+Django settings for running the test suite.
+
+Selected by `manage.py test`; the sharding tests run against two more
+in-memory SQLite databases on top of the regular settings. The throttles
+are off, as every test shares one cache and the same account IDs: the
+throttling tests set the rates they check.
+"""
+
+from bank_account.settings import *  # noqa: F401,F403
+from bank_account.settings import DATABASES, REST_FRAMEWORK
+
+for index in (1, 2):
+    DATABASES.setdefault(f'shard{index}', {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ''})
+
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_RATES={})
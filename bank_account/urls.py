@@ -1,30 +1,35 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-# Schema view for Swagger documentation
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Bank Account API",
-        default_version='v1',
-        description="API documentation for the Bank Account Kata challenge",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@example.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
 
 urlpatterns = [
-    # Admin site URL
-    path('admin/', admin.site.urls),
-
     # Include URLs from the accounts app
     path('api/', include('accounts.urls')),
+]
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+
+    # Admin site URL
+    urlpatterns.append(path('admin/', admin.site.urls))
+
+if settings.API_DOCS_ENABLED:
+    # drf-yasg is only imported when the Swagger UI is served
+    from rest_framework import permissions
+    from drf_yasg.views import get_schema_view
+
+    from bank_account.api_info import api_info
+
+    # Schema view for Swagger documentation
+    schema_view = get_schema_view(
+        api_info,
+        public=True,
+        permission_classes=[permissions.AllowAny],
+    )
 
     # Swagger UI for API documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-]
+    urlpatterns.append(path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'))
+elif settings.OPENAPI_SCHEMA_FILE.exists():
+    from bank_account.views import openapi_schema
+
+    # Pre-generated OpenAPI schema served as a static document
+    urlpatterns.append(path('openapi.json', openapi_schema, name='schema-json'))
@@ -0,0 +1,19 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+@lru_cache(maxsize=None)
+def read_schema():
+    """
+    Read the pre-generated OpenAPI schema once per process.
+    """
+    return settings.OPENAPI_SCHEMA_FILE.read_bytes()
+
+
+def openapi_schema(request):
+    """
+    View serving the pre-generated OpenAPI schema as a static JSON document.
+    """
+    return HttpResponse(read_schema(), content_type='application/json')
@@ -0,0 +1,103 @@
+"""
+Benchmark of group commit against one commit per ledger request.
+
+Runs a growing number of client threads issuing deposits for a fixed time
+against a file-backed SQLite database, once committing every deposit on its
+own and once through the group-commit writer, and reports the request rate,
+the commit rate and the errors (e.g. "database is locked") of each mode.
+
+Usage:
+    python benchmarks/group_commit.py [--clients 1 4 16 64] [--duration 3]
+"""
+
+import argparse
+import decimal
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bank_account.settings')
+
+from bank_account import settings as project_settings  # noqa: E402
+
+# Use a throwaway database file, so that commits pay for a real fsync
+DATABASE = Path(tempfile.mkdtemp()) / 'benchmark.sqlite3'
+project_settings.DATABASES['default']['NAME'] = DATABASE
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+
+from accounts import ledger  # noqa: E402
+from accounts.group_commit import GroupCommitWriter  # noqa: E402
+from accounts.models import Account, Transaction  # noqa: E402
+
+AMOUNT = decimal.Decimal('1.00')
+
+
+def run(clients, duration, writer):
+    """
+    Run `clients` threads issuing deposits for `duration` seconds.
+
+    Returns:
+    tuple: The number of successful requests, commits and errors.
+    """
+    account_ids = list(Account.objects.order_by('id').values_list('id', flat=True)[:clients])
+    deadline = time.monotonic() + duration
+    succeeded = [0] * clients
+    errors = [0] * clients
+
+    def client(index):
+        while time.monotonic() < deadline:
+            try:
+                if writer is None:
+                    ledger.deposit(account_ids[index], AMOUNT)
+                else:
+                    writer.submit(Transaction.DEPOSIT, account_ids[index], None, AMOUNT)
+                succeeded[index] += 1
+            except Exception:
+                errors[index] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    commits = sum(succeeded) if writer is None else writer.commits
+    return sum(succeeded), commits, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16, 64], help='Client thread counts')
+    parser.add_argument('--duration', type=float, default=3.0, help='Seconds per measurement')
+    parser.add_argument('--max-batch', type=int, default=100, help='Group commit batch size')
+    parser.add_argument('--max-delay', type=float, default=0.002, help='Group commit gathering delay in seconds')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    Account.objects.bulk_create([
+        Account(iban=f'DE{index:020d}', balance=0) for index in range(max(args.clients))
+    ])
+    connection.close()
+
+    print(f"{'mode':<14}{'clients':>8}{'requests/s':>12}{'commits/s':>11}{'per commit':>12}{'errors':>8}")
+    for clients in args.clients:
+        for mode in ('per-request', 'group-commit'):
+            writer = GroupCommitWriter(args.max_batch, args.max_delay) if mode == 'group-commit' else None
+            succeeded, commits, errors = run(clients, args.duration, writer)
+            per_commit = succeeded / commits if commits else 0
+            print(f'{mode:<14}{clients:>8}{succeeded / args.duration:>12.0f}{commits / args.duration:>11.0f}'
+                  f'{per_commit:>12.1f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of cold-start cost in development and production mode.
+
+Each sample runs in a fresh interpreter and measures:
+
+* import time: loading the settings, setting up the apps and building the WSGI application;
+* first request: the first `GET /api/accounts/`, which imports the URLconf and the views.
+
+Usage:
+    python benchmarks/startup.py [--runs 10]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# Code run in each fresh interpreter; prints the timings as JSON
+SAMPLE = """
+import json, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+imported = time.perf_counter()
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+connection.creation.create_test_db(verbosity=0)
+
+requested = time.perf_counter()
+response = Client().get('/api/accounts/')
+assert response.status_code == 200, response.status_code
+finished = time.perf_counter()
+print(json.dumps({'import': imported - started, 'first_request': finished - requested}))
+"""
+
+
+def sample(production):
+    """
+    Run one cold start in a fresh interpreter and return its timings in seconds.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='bank_account.settings')
+    env.pop('BANK_ACCOUNT_PRODUCTION', None)
+    if production:
+        env['BANK_ACCOUNT_PRODUCTION'] = '1'
+        env.setdefault('DJANGO_ALLOWED_HOSTS', 'localhost')
+    output = subprocess.run(
+        [sys.executable, '-c', SAMPLE], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Number of cold starts per mode')
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'import (ms)':>14}{'first request (ms)':>22}{'total (ms)':>14}")
+    for name, production in (('development', False), ('production', True)):
+        samples = [sample(production) for _ in range(args.runs)]
+        imported = statistics.median(s['import'] for s in samples) * 1000
+        first_request = statistics.median(s['first_request'] for s in samples) * 1000
+        print(f'{name:<12}{imported:>14.1f}{first_request:>22.1f}{imported + first_request:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
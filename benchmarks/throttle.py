@@ -0,0 +1,66 @@
+"""
+Benchmark of the per-request overhead of the token bucket throttles.
+
+Times `allow_request` for the API key and account throttles against the
+configured cache, for requests that are allowed and requests that are rejected.
+
+Usage:
+    python benchmarks/throttle.py [--requests 100000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bank_account.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.views import APIView  # noqa: E402
+
+from accounts.throttling import AccountRateThrottle, ApiKeyRateThrottle, IpRateThrottle  # noqa: E402
+
+
+def measure(throttle_class, rate, requests):
+    """
+    Return the mean time in microseconds of one `allow_request` call and the share of allowed calls.
+    """
+    caches[settings.THROTTLE_CACHE].clear()
+    view = APIView()
+    view.kwargs = {'pk': 1}
+    request = Request(RequestFactory().post('/api/accounts/1/deposit/', HTTP_X_API_KEY='benchmark'))
+    throttle = throttle_class()
+    scope = f'{throttle_class.scope_prefix}_write'
+    with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {scope: rate}}):
+        allowed = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            allowed += throttle.allow_request(request, view)
+        elapsed = time.perf_counter() - started
+    return elapsed / requests * 1_000_000, allowed / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100_000, help='Number of calls per measurement')
+    args = parser.parse_args()
+
+    print(f'cache backend: {settings.CACHES[settings.THROTTLE_CACHE]["BACKEND"]}')
+    print(f"{'throttle':<22}{'case':<12}{'us/request':>12}{'allowed':>10}")
+    for throttle_class in (IpRateThrottle, ApiKeyRateThrottle, AccountRateThrottle):
+        for case, rate in (('allowed', f'{args.requests * 10}/s'), ('rejected', '1/d')):
+            overhead, allowed = measure(throttle_class, rate, args.requests)
+            print(f'{throttle_class.__name__:<22}{case:<12}{overhead:>12.2f}{allowed:>10.1%}')
+
+
+if __name__ == '__main__':
+    main()
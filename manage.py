@@ -6,6 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    # The test suite adds the databases of the sharding tests to the regular settings
+    if sys.argv[1:2] == ['test']:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bank_account.test_settings')
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bank_account.settings')
     try:
         from django.core.management import execute_from_command_line